@@ -56,6 +56,9 @@ from . import (
     tri_in,
     tri_out,
     texanim,
+    texatlas,
+    shadow,
+    vertexbake,
     tools,
     w_in,
     w_out,
@@ -79,6 +82,9 @@ importlib.reload(common)
 importlib.reload(layers)
 importlib.reload(operators)
 importlib.reload(texanim)
+importlib.reload(texatlas)
+importlib.reload(shadow)
+importlib.reload(vertexbake)
 importlib.reload(tools)
 
 # Reloads ui
@@ -141,10 +147,10 @@ from .layers import set_face_ncp_property, get_face_ncp_property, get_face_env,
 from .layers import get_face_property, set_face_property, update_fin_envcol, set_rgb, get_rgb, update_fin_col, get_alpha_items
 from .layers import update_fin_env, update_rgb, update_no_envmapping, update_envmapping, remove_env_material
 from .operators import ImportRV, ExportRV, RVIO_OT_ReadCarParameters, RVIO_OT_SelectRevoltDirectory, ButtonReExport
-from .operators import VertexAndAlphaLayer, VertexColorRemove, SetVertexColor, BakeShadow, BakeVertex, BatchBakeVertexToEnv, BakeVertexToRGBModelColor
+from .operators import VertexAndAlphaLayer, VertexColorRemove, SetVertexColor, BakeShadow, BakeVertex, BatchBakeVertexToEnv, BakeVertexToRGBModelColor, BakeVertexCPU
 from .operators import SetVertexAlpha, SetFaceTextureNumber
 from .operators import ButtonRenameAllObjects, SelectByName, SelectByData, MaterialAssignment, MaterialAssignmentAuto, TextureAssigner
-from .operators import SetInstanceProperty, RemoveInstanceProperty, LaunchRV, TexturesSave
+from .operators import SetInstanceProperty, RemoveInstanceProperty, LaunchRV, TexturesSave, TexturesPackAtlas, TexturesFullResolution
 from .operators import TexturesRename, CarParametersExport, ButtonZoneHide, AddTrackZone, ReverseTrackZone, ButtonTriggerHide, CreateTrigger
 from .operators import DuplicateTrigger, CopyTrigger, PasteTrigger, SetBCubeMeshIndices, ButtonHullGenerate, ButtonHullSphere
 from .operators import ButtonCopyUvToFrame, ButtonCopyFrameToUv, PreviewNextFrame, PreviewPrevFrame, TexAnimTransform, TexAnimGrid
@@ -155,6 +161,7 @@ from .rvstruct import LookupList, Hull, ConvexHull, Edge, Interior, Sphere, RIM,
 from .rvstruct import Triggers, Trigger
 from .texanim import update_ta_max_frames, update_ta_current_slot, update_ta_current_frame, update_ta_current_frame_uv
 from .texanim import update_ta_current_frame_delay, update_ta_current_frame_tex, update_ta_max_slots
+from .texanim import TexAnimUV, TexAnimFrame, TexAnimSlot, migrate_legacy_animations
 from .tools import get_trigger_type_items, get_trigger_type, set_trigger_type, get_low_flag_items, get_low_flag, set_low_flag, get_high_flag_items
 from .tools import get_high_flag, set_high_flag, set_material_to_col_for_object, set_material_to_texture_for_object
 from .ui.faceprops import RVIO_PT_RevoltFacePropertiesPanel
@@ -207,6 +214,22 @@ def edit_object_change_handler(scene):
         # If the object is not in edit mode, clear the dictionary
         bmesh_dic.clear()
 
+@persistent
+def decoded_images_save_handler(*args):
+    """
+    Switches images decoded in memory back to their files before saving,
+    so the .blend file refers to the original textures.
+    """
+    for image in bpy.data.images:
+        if image.source == 'GENERATED':
+            img_in.use_file_source(image)
+
+@persistent
+def texture_animations_load_handler(*args):
+    """Moves texture animations of files saved with the old text storage to the slots."""
+    for scene in bpy.data.scenes:
+        migrate_legacy_animations(scene)
+
 def register():
     
     #Register Custom Properties
@@ -340,6 +363,21 @@ def register():
         default=True
     )
   
+    bpy.types.Scene.sort_polygons = bpy.props.BoolProperty(
+        name = "Sort Polygons",
+        default = False,
+        description = "Groups the polygons of each mesh by texture and "
+                      "render flags to reduce state changes in-game"
+    )
+
+    bpy.types.Scene.optimize_vertex_cache = bpy.props.BoolProperty(
+        name = "Optimize Vertex Cache",
+        default = False,
+        description = "Reorders the polygons of each texture group for the "
+                      "vertex cache and renumbers the vertices in the order "
+                      "they are used"
+    )
+
     bpy.types.Scene.use_tex_num = bpy.props.BoolProperty(
         name = "Use Number for Textures",
         default = False,
@@ -371,6 +409,19 @@ def register():
         description="Include camber values in the parameters.txt export",
         default=False
     )
+
+    bpy.types.Scene.prm_generate_lods = bpy.props.BoolProperty(
+        name="Generate LoDs",
+        description="Writes reduced levels of detail after the mesh when "
+                    "it has no hand-made LoDs (|q1, |q2, ...)",
+        default=False
+    )
+
+    bpy.types.Scene.prm_lod_ratios = bpy.props.StringProperty(
+        name="LoD Ratios",
+        description="Comma-separated triangle ratios of the generated LoDs",
+        default="0.5, 0.25"
+    )
     
     bpy.types.Object.is_hull_sphere = bpy.props.BoolProperty(
         name = "Is Interior Sphere",
@@ -461,6 +512,17 @@ def register():
         default=False
     )
     
+    bpy.types.Scene.shadow_engine = bpy.props.EnumProperty(
+        name = "Engine",
+        items = [
+            ('CYCLES', "Cycles", "Bake an ambient occlusion shadow with Cycles"),
+            ('ANALYTIC', "Analytic", "Project the faces onto the ground and "
+                                     "blur them by height (fast, no Cycles needed)"),
+        ],
+        default = 'CYCLES',
+        description = "How the shadow is rendered"
+    )
+
     bpy.types.Scene.shadow_quality = bpy.props.EnumProperty(
         name = "Quality",
         items = [
@@ -502,10 +564,20 @@ def register():
                       "Click to select all, then CTRL C to copy"
     )
     
+    bpy.utils.register_class(TexAnimUV)
+    bpy.utils.register_class(TexAnimFrame)
+    bpy.utils.register_class(TexAnimSlot)
+
+    bpy.types.Scene.ta_slots = bpy.props.CollectionProperty(
+        type=TexAnimSlot,
+        name="Texture Animation Slots",
+        description="Storage for Texture animations. Should not be changed by hand"
+    )
+
     bpy.types.Scene.texture_animations = bpy.props.StringProperty(
-        name="Texture Animations",
+        name="Texture Animations (Legacy)",
         default="[]",
-        description="Storage for Texture animations. Should not be changed by hand"
+        description="Texture animations of older files, moved to the slots when loaded. Internal only"
     )
     
     bpy.types.Scene.ta_max_frames = bpy.props.IntProperty(
@@ -874,6 +946,41 @@ def register():
         update=update_actual_split_size  # Update actual_split_size when split_size_faces changes
     )
 
+    bpy.types.Scene.bigcube_mode = bpy.props.EnumProperty(
+        name="BigCubes",
+        description="How the meshes of the world are grouped into BigCubes "
+                    "for culling",
+        items=[
+            ('SINGLE', "Single", "One BigCube around the whole world"),
+            ('CLUSTER', "Clustered", "Group meshes by their position into "
+                                     "the given number of BigCubes"),
+            ('AUTO', "Automatic", "Use the groups of the WorldCut split, "
+                                  "clustered if the world isn't cut"),
+        ],
+        default='AUTO'
+    )
+
+    bpy.types.Scene.bigcube_count = bpy.props.IntProperty(
+        name="BigCube Count",
+        description="Number of BigCubes to cluster the meshes into",
+        min=1,
+        max=256,
+        default=8
+    )
+
+    bpy.types.Scene.texture_proxy = bpy.props.EnumProperty(
+        name="Texture Previews",
+        description="Loads imported textures at a reduced resolution for "
+                    "the viewport. The original files are used for export",
+        items=[
+            ('1', "Full Size", "Load textures at full resolution"),
+            ('2', "1/2 Size", "Load textures at half resolution"),
+            ('4', "1/4 Size", "Load textures at a quarter of the resolution"),
+            ('8', "1/8 Size", "Load textures at an eighth of the resolution"),
+        ],
+        default='1'
+    )
+
     bpy.types.Scene.actual_split_size = bpy.props.IntProperty(
         name="Actual Split Size",
         description="Calculated number of faces per split based on split_size_faces.",
@@ -969,6 +1076,8 @@ def register():
     bpy.utils.register_class(RemoveInstanceProperty)
     bpy.utils.register_class(LaunchRV)
     bpy.utils.register_class(TexturesSave)
+    bpy.utils.register_class(TexturesPackAtlas)
+    bpy.utils.register_class(TexturesFullResolution)
     bpy.utils.register_class(TexturesRename)
     bpy.utils.register_class(MaterialAssignment)
     bpy.utils.register_class(MaterialAssignmentAuto)
@@ -978,6 +1087,7 @@ def register():
     bpy.utils.register_class(BakeShadow)
     bpy.utils.register_class(BakeVertex)
     bpy.utils.register_class(BatchBakeVertexToEnv)
+    bpy.utils.register_class(BakeVertexCPU)
     bpy.utils.register_class(BakeVertexToRGBModelColor)
     bpy.utils.register_class(ButtonHullSphere)
     bpy.utils.register_class(ButtonCopyUvToFrame)
@@ -1013,11 +1123,15 @@ def register():
     
     # UI and Handlers Registration
     bpy.app.handlers.depsgraph_update_pre.append(edit_object_change_handler)
+    bpy.app.handlers.save_pre.append(decoded_images_save_handler)
+    bpy.app.handlers.load_post.append(texture_animations_load_handler)
 
 def unregister():
     
     # UI and Handlers Unregistration
     bpy.app.handlers.depsgraph_update_pre.remove(edit_object_change_handler)
+    bpy.app.handlers.save_pre.remove(decoded_images_save_handler)
+    bpy.app.handlers.load_post.remove(texture_animations_load_handler)
      
     # Unregister UI
     bpy.utils.unregister_class(RVIO_PT_RevoltObjectPanel)
@@ -1053,6 +1167,7 @@ def unregister():
     bpy.utils.unregister_class(ButtonHullSphere)
     bpy.utils.unregister_class(BakeVertexToRGBModelColor)
     bpy.utils.unregister_class(BatchBakeVertexToEnv)
+    bpy.utils.unregister_class(BakeVertexCPU)
     bpy.utils.unregister_class(BakeVertex)
     bpy.utils.unregister_class(BakeShadow)
     bpy.utils.unregister_class(ButtonHullGenerate) 
@@ -1062,6 +1177,8 @@ def unregister():
     bpy.utils.unregister_class(MaterialAssignment)
     bpy.utils.unregister_class(TexturesRename)
     bpy.utils.unregister_class(TexturesSave)
+    bpy.utils.unregister_class(TexturesPackAtlas)
+    bpy.utils.unregister_class(TexturesFullResolution)
     bpy.utils.unregister_class(LaunchRV)
     bpy.utils.unregister_class(RemoveInstanceProperty)
     bpy.utils.unregister_class(SetInstanceProperty)
@@ -1093,6 +1210,9 @@ def unregister():
 
     del bpy.types.Scene.split_size_faces
     del bpy.types.Scene.actual_split_size
+    del bpy.types.Scene.bigcube_mode
+    del bpy.types.Scene.bigcube_count
+    del bpy.types.Scene.texture_proxy
     del bpy.types.Scene.export_worldcut
 
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
@@ -1139,10 +1259,15 @@ def unregister():
     del bpy.types.Scene.ta_max_frames
     del bpy.types.Scene.ta_max_slots
     del bpy.types.Scene.texture_animations
+    del bpy.types.Scene.ta_slots
+    bpy.utils.unregister_class(TexAnimSlot)
+    bpy.utils.unregister_class(TexAnimFrame)
+    bpy.utils.unregister_class(TexAnimUV)
     del bpy.types.Scene.shadow_table
     del bpy.types.Scene.shadow_strength
     del bpy.types.Scene.shadow_resolution
     del bpy.types.Scene.shadow_quality
+    del bpy.types.Scene.shadow_engine
     del bpy.types.Object.ignore_ncp
     del bpy.types.Object.is_bbox
     del bpy.types.Object.is_cube
@@ -1158,9 +1283,13 @@ def unregister():
     del bpy.types.Object.is_hull_convex
     del bpy.types.Object.is_hull_sphere
     del bpy.types.Scene.export_camber
+    del bpy.types.Scene.prm_generate_lods
+    del bpy.types.Scene.prm_lod_ratios
     del bpy.types.Scene.apply_rotation
     del bpy.types.Scene.apply_scale
     del bpy.types.Scene.use_tex_num
+    del bpy.types.Scene.sort_polygons
+    del bpy.types.Scene.optimize_vertex_cache
     del bpy.types.Scene.triangulate_ngons
     
     del bpy.types.Scene.w_import_cubes
@@ -4,10 +4,13 @@ Purpose: Reading parameters.txt files
 
 Description:
 Used to import entire cars and getting texture paths for models.
+The file is read at once, the reading functions advance a position in
+the text instead of reading single characters from the file.
 
 """
 
 import os
+import re
 import bpy
 from . import common
 
@@ -23,35 +26,67 @@ action_name = "reading parameters"
 global block
 block = None
 
+# Words are separated by spaces, tabs, newlines and commas
+SPACE_RE = re.compile(r"[ \t\n,]*")
+WORD_RE = re.compile(r"[^ \t\n,]*")
+
+
+class ParameterText:
+    """ The text of a parameters.txt file and the current reading position """
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos >= len(self.text)
+
+    def skip_spaces(self):
+        self.pos = SPACE_RE.match(self.text, self.pos).end()
+
+    def read_raw_word(self):
+        """ Reads the characters up to the next space and skips that space """
+        start = self.pos
+        end = WORD_RE.match(self.text, start).end()
+        self.pos = end + 1
+        return self.text[start:end]
+
+    def read_until(self, ch):
+        """ Reads the text up to the character and skips the character """
+        end = self.text.find(ch, self.pos)
+        if end < 0:
+            end = len(self.text)
+        text = self.text[self.pos:end]
+        self.pos = end + 1
+        return text
+
+
+def read_next(fd):
+    """ Skips spaces and reads the next word """
+    fd.skip_spaces()
+    return fd.read_raw_word()
+
+
 def read_word(fd):
     """ Reads a word from the file (usually a keyword which is followed by a 
         value or a block) """
-    word = ""
-
-    ch = fd.read(1)
-
-    if ch == "":
+    if fd.at_end():
         common.queue_error(action_name, "End of file reached.")
         return None
 
-    while is_space(ch) and ch != "":
-        ch = fd.read(1)
+    fd.skip_spaces()
 
     # Skips comments
-    while ch == ";" and ch != "":
-        ch = fd.read(1)
+    text = fd.text
+    while text.startswith(";", fd.pos):
+        fd.pos += 1
 
         # Checks for backwards compatible words
-        if ch not in [")", "\n"]:
-            ch = skip_line(fd)
+        if fd.at_end() or text[fd.pos] not in ")\n":
+            skip_line(fd)
         else:
-            ch = fd.read(1)
+            fd.pos += 1
 
-    while not is_space(ch) and ch != "":
-        word += ch
-        ch = fd.read(1)
-
-    return word
+    return fd.read_raw_word()
 
 
 def read_model(fd):
@@ -64,50 +99,17 @@ def read_model(fd):
 
 def read_int(fd):
     """ Reads a word and interprets it as an integer """
-    integer = ""
-    ch = fd.read(1)
-
-    while is_space(ch):
-        ch = fd.read(1)
-
-    while not is_space(ch):
-        integer += ch
-        ch = fd.read(1)
-
-    return int(integer)
+    return int(read_next(fd))
 
 
 def read_bool(fd):
     """ Reads a word and interprets it as a boolean """
-    bool = ""
-    ch = fd.read(1)
-
-    while is_space(ch):
-        ch = fd.read(1)
-
-    while not is_space(ch):
-        bool += ch
-        ch = fd.read(1)
-
-    if bool.lower() in ["true", "1", "yes"]:
-        return True
-    else:
-        return False
+    return read_next(fd).lower() in ["true", "1", "yes"]
 
 
 def read_float(fd):
     """ Reads a word and interprets it as a float """
-    flt = ""
-    ch = fd.read(1)
-
-    while is_space(ch):
-        ch = fd.read(1)
-        
-    while not is_space(ch):
-        flt += ch
-        ch = fd.read(1)
-
-    return float(flt)
+    return float(read_next(fd))
 
 
 def read_vector_float(fd):
@@ -138,19 +140,12 @@ def read_vector_int(fd):
 
 def read_string(fd):
     """ Reads a word encased by " """
-    string = ""
-    ch = fd.read(1)
-
     # Finds the " and advances the the first letter of the string
-    while not ch == "\"":
-        ch = fd.read(1)
-    ch = fd.read(1)
-    
+    fd.read_until("\"")
+
     # Adds characters to the string until " has been reached
-    while not ch == "\"":
-        string += ch
-        ch = fd.read(1)
-    ch = fd.read(1)
+    string = fd.read_until("\"")
+    fd.pos += 1
 
     return string
 
@@ -184,12 +179,7 @@ def read_ambivalent(fd):
 
 def read_number_list(fd):
     """ Reads a list of numbers, e.g. 0-3 or 1, 2, 3"""
-    nlist = ""
-    ch = fd.read(1)
-
-    while ch != "{":
-        nlist += ch
-        ch = fd.read(1)
+    nlist = fd.read_until("{")
 
     nlist = nlist.strip()
 
@@ -208,9 +198,7 @@ def read_struct(fd):
     """ Reads a regular structure block encased by {} """
     struct = {}
     # Skips to the first opening bracket
-    ch = fd.read(1)
-    while ch != "{":
-        ch = fd.read(1)
+    fd.read_until("{")
 
     struct = process_words(fd)
 
@@ -276,15 +264,7 @@ def process_words(fd):
 
 def read_camber(fd):
     """ Reads camber angle, accounting for optional ;)Camber tag """
-    flt = ""
-    ch = fd.read(1)
-
-    while is_space(ch):
-        ch = fd.read(1)
-        
-    while not is_space(ch):
-        flt += ch
-        ch = fd.read(1)
+    flt = read_next(fd)
 
     # Remove the ;) and return the float value
     flt = flt.replace(";", "").replace(")", "").strip()
@@ -294,15 +274,8 @@ def read_camber(fd):
 """ Helper functions for processing files """
 
 def skip_line(fd):
-    ch = fd.read(1)
-    while ch != "\n" and ch != '':
-        ch = fd.read(1)
-    ch = fd.read(1)
-    return ch
-
-
-def is_space(ch):
-    return ch in [" ", "\t", "\n", ","]
+    """ Advances to the first character of the next line """
+    fd.read_until("\n")
 
 
 """ Stores keywords and the functions their values have to be read with """
@@ -419,6 +392,6 @@ dispatcher = {
 
 def read_parameters(filepath):
     print("Reading {}...".format(filepath))
-    with open(filepath) as fd:
-        parameters = read_struct(fd)
-        return parameters
\ No newline at end of file
+    with open(filepath) as file:
+        fd = ParameterText(file.read())
+    return read_struct(fd)
\ No newline at end of file
@@ -17,13 +17,14 @@ import bmesh
 import os
 import math
 import mathutils
+import numpy as np
+from collections import OrderedDict
 from math import sqrt
 from mathutils import Color, Matrix, Vector
 
 # Global dictionaries
 global ERRORS
 ERRORS = {}  # Dictionary that holds error messages
-PARAMETERS = {}  # Glocal dict to hold parameters
 
 # If True, more debug messages will be printed
 DEBUG =             True
@@ -82,6 +83,17 @@ FACE_PROP_MASK = (
 	FACE_CLOTH
 )
 
+# Flags that change how a polygon is rendered (used for sorting on export)
+FACE_STATE_MASK = (
+	FACE_DOUBLE |
+	FACE_TRANSLUCENT |
+	FACE_MIRROR |
+	FACE_TRANSL_TYPE |
+	FACE_TEXANIM |
+	FACE_NOENV |
+	FACE_ENV
+)
+
 FACE_PROPS = [
 	FACE_QUAD,
 	FACE_DOUBLE,
@@ -386,6 +398,65 @@ def radius_from_bmesh(bm, center):
 	return radius
 
 
+def bounding_sphere(points, iterations=100):
+	"""
+	Gets a near-minimal sphere around an (n, 3) array of points as
+	(center, radius). Ritter's sphere is refined by moving its center
+	towards the furthest point with decreasing steps (Badoiu-Clarkson).
+	The bbox center is used instead if that gives a smaller sphere.
+	"""
+	points = np.asarray(points, dtype=np.float64)
+
+	def get_radius(center):
+		return np.sqrt(((points - center) ** 2).sum(axis=1)).max()
+
+	# Ritter's initial sphere: the diameter between two far apart points
+	a = points[np.argmax(((points - points[0]) ** 2).sum(axis=1))]
+	b = points[np.argmax(((points - a) ** 2).sum(axis=1))]
+	center = (a + b) / 2
+
+	best_center = (points.min(axis=0) + points.max(axis=0)) / 2
+	best_radius = get_radius(best_center)
+
+	for i in range(1, iterations + 1):
+		dist = ((points - center) ** 2).sum(axis=1)
+		far = np.argmax(dist)
+		radius = sqrt(dist[far])
+		if radius < best_radius:
+			best_center, best_radius = center, radius
+		center = center + (points[far] - center) / (i + 1)
+
+	return tuple(float(c) for c in best_center), float(best_radius)
+
+
+def gaussian_blur(pixels, sigma):
+	"""
+	Blurs a (height, width, channels) float array with a Gaussian kernel.
+	The convolution is done with FFTs on a copy padded by repeating the
+	edge pixels, so the cost doesn't depend on the blur radius.
+	"""
+	radius = int(np.ceil(sigma * 3))
+	if sigma <= 0 or radius < 1:
+		return pixels
+	kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+	kernel /= kernel.sum()
+
+	pad = [(radius, radius), (radius, radius)] + [(0, 0)] * (pixels.ndim - 2)
+	padded = np.pad(pixels, pad, mode='edge')
+	height, width = padded.shape[:2]
+
+	# Kernel spectra of both axes, centered on the first element
+	kernel_y = np.zeros(height)
+	kernel_y[:kernel.size] = kernel
+	kernel_x = np.zeros(width)
+	kernel_x[:kernel.size] = kernel
+	spectrum = np.fft.fft(np.roll(kernel_y, -radius))[:, None] * np.fft.rfft(np.roll(kernel_x, -radius))[None, :]
+	spectrum = spectrum.reshape(spectrum.shape + (1,) * (pixels.ndim - 2))
+
+	blurred = np.fft.irfft2(np.fft.rfft2(padded, axes=(0, 1)) * spectrum, s=(height, width), axes=(0, 1))
+	return blurred[radius:height - radius, radius:width - radius].astype(np.float32)
+
+
 def reverse_quad(quad, tri=False):
 	if tri:
 		return quad[2::-1]
@@ -766,11 +837,45 @@ def check_for_export(obj):
 Non-Blender helper functions
 """
 
+# Maximum amount of parsed parameters.txt files kept in memory
+PARAMETERS_CACHE_SIZE = 64
+
+class ParameterCache:
+	"""
+	Keeps the most recently used parameters.txt files parsed. An entry is
+	read again when the file's size or modification time has changed.
+	"""
+	def __init__(self, max_size=PARAMETERS_CACHE_SIZE):
+		self.max_size = max_size
+		self.entries = OrderedDict()  # path -> ((size, mtime), parameters)
+
+	def get(self, filepath):
+		from .carinfo import read_parameters
+
+		key = os.path.normcase(os.path.abspath(filepath))
+		stat = os.stat(filepath)
+		version = (stat.st_size, stat.st_mtime_ns)
+
+		entry = self.entries.get(key)
+		if entry is not None and entry[0] == version:
+			self.entries.move_to_end(key)
+			return entry[1]
+
+		parameters = read_parameters(filepath)
+		self.entries[key] = (version, parameters)
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.max_size:
+			self.entries.popitem(last=False)
+		return parameters
+
+	def clear(self):
+		self.entries.clear()
+
+PARAMETERS = ParameterCache()  # Parsed parameters.txt files by path
+
 def get_texture_path(filepath, tex_num, scene):
 	""" Gets the full texture path when given a file and its
 		polygon texture number. """
-		
-	from .carinfo import read_parameters
 
 	path, fname = filepath.rsplit(os.sep, 1)
 
@@ -786,9 +891,7 @@ def get_texture_path(filepath, tex_num, scene):
 	# The file is part of a car
 	if "parameters.txt" in os.listdir(path):
 		filepath = os.path.join(path, "parameters.txt")
-		if not filepath in PARAMETERS:
-			PARAMETERS[filepath] = read_parameters(filepath)
-		tpage = PARAMETERS[filepath]["tpage"].split(os.sep)[-1]
+		tpage = PARAMETERS.get(filepath)["tpage"].split(os.sep)[-1]
 
 		return os.path.join(path, tpage)
 
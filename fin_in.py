@@ -18,6 +18,7 @@ from . import prm_in
 from .common import to_trans_matrix, to_blender_coord, FIN_SET_MODEL_RGB, FIN_ENV, FIN_HIDE, FIN_NO_MIRROR, FIN_NO_LIGHTS
 from .common import FIN_NO_OBJECT_COLLISION, FIN_NO_CAMERA_COLLISION
 from .rvstruct import Instances, Vector
+from .tools import assign_materials
 from mathutils import Color
 
 # Check if 'bpy' is already in locals to determine if this is a reload scenario
@@ -31,51 +32,94 @@ def import_file(filepath, scene):
         fin = Instances(file)
         print("Imported FIN file.")
 
+    # The folder is only listed once, every PRM is only decoded once
+    folder = os.sep.join(filepath.split(os.sep)[:-1])
+    prm_index = index_prm_files(folder)
+    mesh_cache = {}
+
     # Import each instance
-    for instance in fin.instances:
-        import_instance(filepath, scene, instance)
+    instance_objs = [
+        import_instance(filepath, scene, instance, prm_index, mesh_cache)
+        for instance in fin.instances
+    ]
+
+    print("Created {} instances from {} PRM files.".format(
+        len(fin.instances), len(mesh_cache)))
 
     # After importing all instances, run the texture assignment
-    assign_material_to_all(scene)
+    assign_materials([obj for obj in instance_objs if obj.type == 'MESH'])
 
-def import_instance(filepath, scene, instance):
-    scene = bpy.context.scene
+def index_prm_files(folder):
+    """
+    Lists the PRM files of a folder once. Holds the file names in folder
+    order and a dict for resolved instance names.
+    """
+    files = [f for f in os.listdir(folder) if f.endswith(".prm")]
+    return {"folder": folder, "files": files, "names": set(files), "resolved": {}}
 
-    folder = os.sep.join(filepath.split(os.sep)[:-1])
-
-    # Clean up the instance name
-    instance_name = clean_instance_name(instance.name)
+def find_prm_fname(instance_name, prm_index):
+    """ Resolves an instance name to a PRM file name using the folder index """
+    resolved = prm_index["resolved"]
+    if instance_name in resolved:
+        return resolved[instance_name]
 
     # Determine the expected PRM filename
     expected_prm_fname = instance_name if instance_name.endswith(".prm") else f"{instance_name}.prm"
 
     # Try to find the exact file name
-    prm_fname = None
-    for f in os.listdir(folder):
-        if f == expected_prm_fname:
-            prm_fname = f
-            break
+    prm_fname = expected_prm_fname if expected_prm_fname in prm_index["names"] else None
 
     # If no exact match was found, try to find a file that starts with the cleaned instance name
     if not prm_fname:
-        for f in os.listdir(folder):
-            if f.startswith(instance_name) and f.endswith(".prm"):
+        for f in prm_index["files"]:
+            if f.startswith(instance_name):
                 prm_fname = f
                 break
 
+    resolved[instance_name] = prm_fname
+    return prm_fname
+
+def get_instance_mesh(prm_fname, scene, prm_index, mesh_cache):
+    """
+    Returns the shared mesh for a PRM file. The PRM is decoded and built only
+    once, objects that already exist in the scene are reused.
+    """
+    if prm_fname in mesh_cache:
+        return mesh_cache[prm_fname]
+
     # Check if the object with this name already exists in the scene
-    if prm_fname in [ob.name for ob in scene.objects]:
-        data = scene.objects[prm_fname].data
+    existing = scene.objects.get(prm_fname)
+    if existing is not None and existing.data is not None:
+        me = existing.data
+    else:
+        prm_path = os.path.join(prm_index["folder"], prm_fname)
+        me = prm_in.import_meshes(prm_path, scene)[0]
 
-        # Create a duplicate object and link it to the scene
-        instance_obj = bpy.data.objects.new(name=prm_fname, object_data=data)
-        if instance_obj is not None:
-            scene.collection.objects.link(instance_obj)
+    mesh_cache[prm_fname] = me
+    return me
+
+def import_instance(filepath, scene, instance, prm_index=None, mesh_cache=None):
+    scene = bpy.context.scene
+
+    if prm_index is None:
+        prm_index = index_prm_files(os.sep.join(filepath.split(os.sep)[:-1]))
+    if mesh_cache is None:
+        mesh_cache = {}
+
+    # Clean up the instance name
+    instance_name = clean_instance_name(instance.name)
+
+    prm_fname = find_prm_fname(instance_name, prm_index)
 
-    elif prm_fname:
-        prm_path = os.path.join(folder, prm_fname)
-        # Create the object and link it to the scene
-        instance_obj = prm_in.import_file(prm_path, scene)
+    if prm_fname:
+        is_new_mesh = prm_fname not in mesh_cache
+        data = get_instance_mesh(prm_fname, scene, prm_index, mesh_cache)
+
+        # Every instance is a new object pointing at the shared mesh
+        instance_obj = bpy.data.objects.new(name=prm_fname, object_data=data)
+        scene.collection.objects.link(instance_obj)
+        if is_new_mesh:
+            prm_in.assign_uv_tex_material(instance_obj)
 
     else:
         # Create an empty object if no PRM file was found
@@ -252,40 +296,3 @@ def clean_instance_name(name):
     
     # Reattach the .prm extension if it was originally there
     return f"{base_name}.prm" if name.endswith(".prm") else base_name
-
-def assign_material_to_all(scene):
-    """Assign material to all imported objects for both COL and UV_TEX."""
-    # Get all mesh objects in the scene
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-    
-    # Run texture assignment for both material choices
-    set_material_to_col(mesh_objects)
-    set_material_to_texture(mesh_objects)
-
-def set_material_to_col(mesh_objects):
-    """Sets the material to Vertex Colour (_Col) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'COL'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture(mesh_objects):
-    """Sets the material to Texture (UV_TEX) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'UV_TEX'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
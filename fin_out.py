@@ -20,7 +20,7 @@ from . import prm_out
 from .rvstruct import Instances, Instance, Vector, Color, Matrix
 from .common import to_revolt_coord, FIN_SET_MODEL_RGB, to_or_matrix, FIN_ENV, FIN_HIDE, FIN_NO_MIRROR, FIN_NO_LIGHTS
 from .common import FIN_NO_CAMERA_COLLISION, FIN_NO_OBJECT_COLLISION
-from .tools import set_material_to_col_for_object, set_material_to_texture_for_object
+from .tools import assign_materials
 
 if "bpy" in locals():
     import imp
@@ -42,10 +42,8 @@ def export_file(filepath, scene):
         print("No mesh objects available for export.")
         return
 
-    # Apply material settings using the imported utility functions
-    for obj in mesh_objects:
-        set_material_to_col_for_object(obj)
-        set_material_to_texture_for_object(obj)
+    # Apply material settings for both COL and UV_TEX
+    assign_materials(mesh_objects)
 
     # Perform the export process
     objs = [obj for obj in mesh_objects if obj.get("is_instance", False)]
@@ -154,40 +152,6 @@ def export_file(filepath, scene):
 
     print(f"Exported {len(fin.instances)} instances to {filepath}")
 
-def set_material_to_col():
-    """Sets the material to Vertex Colour (_Col) for all selected mesh objects."""
-    mesh_objects = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-    
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        bpy.context.view_layer.objects.active = obj
-        obj.data.material_choice = 'COL'
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture():
-    """Sets the material to Texture (UV_TEX) for all selected mesh objects."""
-    mesh_objects = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-    
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        bpy.context.view_layer.objects.active = obj
-        obj.data.material_choice = 'UV_TEX'
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-        
 def get_base_name_for_layers(obj):
     """Generates a clean base name for the object by removing unnecessary suffixes and handling extensions."""
     name = obj.name.lower()
@@ -3,14 +3,39 @@ Name:    img_in
 Purpose: Imports image files.
 
 Description:
-
+Textures are shared by content: identical bitmaps shipped under different
+names or folders are loaded once and use the same material.
+Texture pages of a model can be decoded up front in a thread pool, the
+main thread then only creates the images from the decoded pixels.
 
 """
 
 import bpy
 import os
+import time
+import struct
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .common import texture_to_int
+
+# Custom property holding the content key of imported images and materials
+CONTENT_KEY = "rv_content_key"
+
+# (path, size, mtime) -> file hash, so unchanged files are only read once
+FILE_HASHES = {}
+
+# Custom property holding the downscale factor of preview images
+PROXY_KEY = "rv_proxy_factor"
 
-def load_image(filepath, img_num):
+# Custom property of images created from pixels decoded by the add-on,
+# they are generated images until switched to their file
+DECODED_KEY = "rv_decoded"
+
+# Duplicate textures reused since the last report
+SHARED_STATS = {"images": 0, "bytes": 0}
+
+def load_image(filepath, img_num, proxy_factor=1):
     # Guesses texture name and path
     texture_name = str(img_num) + ".bmp"
 
@@ -19,6 +44,7 @@ def load_image(filepath, img_num):
         # Sets a fake user because it doesn't get automatically set
         image.use_fake_user = True
         image.name = texture_name
+        make_proxy(image, proxy_factor)
     else:
         # Finds existing dummy texture
         for img in bpy.data.images:
@@ -32,5 +58,333 @@ def load_image(filepath, img_num):
 
     return image
 
-def import_file(filepath, img_num = 0):
-    return load_image(filepath, img_num)
+def import_file(filepath, img_num = 0, proxy_factor=1):
+    return load_image(filepath, img_num, proxy_factor)
+
+
+def get_file_key(filepath):
+    stat = os.stat(filepath)
+    return (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+
+
+def get_file_hash(filepath):
+    """ Gets the SHA-1 of a file, cached by path, size and modification time """
+    key = get_file_key(filepath)
+    digest = FILE_HASHES.get(key)
+    if digest is None:
+        sha = hashlib.sha1()
+        with open(filepath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        FILE_HASHES[key] = digest
+    return digest
+
+
+def get_content_key(filepath):
+    """
+    Gets the key identifying a texture by content. The texture page is part
+    of the key since exports read the page number from the image name.
+    """
+    page = texture_to_int(os.path.basename(filepath))
+    return "{}:{}".format(get_file_hash(filepath), page)
+
+
+class ContentIndex:
+    """
+    Maps content keys to the names of the images or materials holding them,
+    so lookups don't walk the whole collection. The index is rebuilt when a
+    name has gone stale or datablocks were added or removed elsewhere.
+    """
+    def __init__(self, collection_name):
+        self.collection_name = collection_name
+        self.names = {}
+        self.count = -1     # Collection size the index is complete for
+
+    def get_collection(self):
+        return getattr(bpy.data, self.collection_name)
+
+    def rebuild(self, collection):
+        self.names = {}
+        for item in collection:
+            key = item.get(CONTENT_KEY)
+            if key is not None:
+                self.names.setdefault(key, item.name)
+        self.count = len(collection)
+
+    def find(self, key):
+        """ Gets the datablock with the content key or None """
+        collection = self.get_collection()
+        name = self.names.get(key)
+        if name is None and self.count == len(collection):
+            return None
+
+        item = collection.get(name) if name is not None else None
+        if item is not None and item.get(CONTENT_KEY) == key:
+            return item
+
+        self.rebuild(collection)
+        name = self.names.get(key)
+        return collection.get(name) if name is not None else None
+
+    def add(self, item, key):
+        """ Sets the content key of a datablock and indexes it """
+        item[CONTENT_KEY] = key
+        self.names[key] = item.name
+        # Stays complete if this is the only datablock added since
+        count = len(self.get_collection())
+        if self.count in (count, count - 1):
+            self.count = count
+
+
+IMAGE_INDEX = ContentIndex("images")
+MATERIAL_INDEX = ContentIndex("materials")
+
+
+def get_proxy_factor(scene):
+    """ Gets the texture downscale factor set for imports """
+    return int(getattr(scene, "texture_proxy", '1'))
+
+
+def box_filter(pixels, factor):
+    """
+    Downscales (height, width, channels) pixels by an integer factor by
+    averaging each factor x factor block. Odd edges are cropped.
+    """
+    height, width, channels = pixels.shape
+    height, width = height // factor, width // factor
+    blocks = pixels[:height * factor, :width * factor].reshape(height, factor, width, factor, channels)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def make_proxy(image, factor):
+    """
+    Replaces the pixels of a loaded image by a downscaled preview. The name
+    and file path stay the same, so exports and texture numbers still refer
+    to the original file.
+    """
+    width, height = image.size
+    if factor <= 1 or width < factor or height < factor or image.get(PROXY_KEY):
+        return
+
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    preview = box_filter(pixels.reshape(height, width, 4), factor)
+
+    image.scale(preview.shape[1], preview.shape[0])
+    image.pixels.foreach_set(preview.ravel())
+    image[PROXY_KEY] = factor
+
+
+def restore_full_resolution(image):
+    """ Reloads a proxy image from its original file """
+    if not image.get(PROXY_KEY):
+        return False
+    # Images decoded by the add-on are generated until switched to the file
+    if image.source != 'FILE':
+        image.source = 'FILE'
+    image.reload()
+    del image[PROXY_KEY]
+    if image.get(DECODED_KEY) is not None:
+        del image[DECODED_KEY]
+    return True
+
+
+def use_file_source(image):
+    """
+    Switches an image decoded by the add-on to its file. Full size images
+    aren't reloaded here, Blender reads the file once the pixels are needed
+    again. Proxies are reloaded at full resolution.
+    """
+    if image.get(PROXY_KEY):
+        return restore_full_resolution(image)
+    if not image.get(DECODED_KEY):
+        return False
+    image.source = 'FILE'
+    del image[DECODED_KEY]
+    return True
+
+
+def load_shared_image(filepath, proxy_factor=1):
+    """
+    Loads an image or returns an already loaded image with identical
+    content (and texture page). New images are downscaled to proxies if a
+    proxy factor is given.
+    """
+    key = get_content_key(filepath)
+    image = IMAGE_INDEX.find(key)
+
+    if image is None:
+        image = bpy.data.images.load(filepath, check_existing=True)
+        IMAGE_INDEX.add(image, key)
+        make_proxy(image, proxy_factor)
+    elif os.path.normcase(bpy.path.abspath(image.filepath)) != os.path.normcase(os.path.abspath(filepath)):
+        # Blender stores loaded 8-bit images as RGBA bytes
+        width, height = image.size
+        SHARED_STATS["images"] += 1
+        SHARED_STATS["bytes"] += width * height * 4
+        print("Reusing {} for identical texture {}".format(image.name, filepath))
+
+    return image
+
+
+def get_texture_material(filepath, proxy_factor=1):
+    """ Gets the material of a texture, shared between identical textures """
+    image = load_shared_image(filepath, proxy_factor)
+    key = image[CONTENT_KEY]
+    material = MATERIAL_INDEX.find(key)
+    if material is not None:
+        return material
+
+    name = os.path.basename(filepath)
+    material = bpy.data.materials.get(name)
+    if material is None or not material.node_tree or not any(
+            node.type == 'TEX_IMAGE' and node.image == image for node in material.node_tree.nodes):
+        material = bpy.data.materials.new(name=name)
+        material.use_nodes = True
+        bsdf = material.node_tree.nodes.get('Principled BSDF')
+        tex_image = material.node_tree.nodes.new('ShaderNodeTexImage')
+        tex_image.image = image
+        material.node_tree.links.new(bsdf.inputs['Base Color'], tex_image.outputs['Color'])
+    MATERIAL_INDEX.add(material, key)
+    return material
+
+
+def report_shared_images():
+    """ Prints the memory saved by shared textures and resets the counter """
+    if SHARED_STATS["images"]:
+        print("Shared {} duplicate textures, saved {:.1f} MB of image memory.".format(
+            SHARED_STATS["images"], SHARED_STATS["bytes"] / (1024 * 1024)))
+    SHARED_STATS["images"] = 0
+    SHARED_STATS["bytes"] = 0
+
+
+def decode_bmp(data):
+    """
+    Decodes an uncompressed 8, 24 or 32 bit bitmap into a (height, width, 4)
+    uint8 RGBA array with the bottom row first, like Blender stores pixels.
+    Returns None for other formats.
+    """
+    if len(data) < 54 or data[:2] != b'BM':
+        return None
+    offset, = struct.unpack_from("<I", data, 10)
+    header_size, width, height, planes, bpp, compression = struct.unpack_from("<IiiHHI", data, 14)
+    colors_used, = struct.unpack_from("<I", data, 46)
+    if compression != 0 or bpp not in (8, 24, 32) or width <= 0 or height == 0:
+        return None
+
+    rows = abs(height)
+    stride = (width * bpp + 31) // 32 * 4
+    if offset + stride * rows > len(data):
+        return None
+    pixels = np.frombuffer(data, dtype=np.uint8, count=stride * rows, offset=offset).reshape(rows, stride)
+
+    rgba = np.empty((rows, width, 4), dtype=np.uint8)
+    rgba[..., 3] = 255
+    if bpp == 8:
+        num_colors = colors_used or 256
+        palette = np.frombuffer(data, dtype=np.uint8, count=num_colors * 4, offset=14 + header_size)
+        palette = palette.reshape(num_colors, 4)
+        indices = np.minimum(pixels[:, :width], num_colors - 1)
+        rgba[..., :3] = palette[indices, 2::-1]
+    else:
+        channels = bpp // 8
+        # Bitmaps store BGR(A)
+        bgra = pixels[:, :width * channels].reshape(rows, width, channels)
+        rgba[..., :3] = bgra[..., 2::-1]
+        # BGRX files leave the fourth byte at 0, they stay opaque
+        if bpp == 32 and bgra[..., 3].any():
+            rgba[..., 3] = bgra[..., 3]
+
+    # Negative heights are stored top-down
+    if height < 0:
+        rgba = rgba[::-1]
+    return rgba
+
+
+def decode_texture(filepath, proxy_factor=1):
+    """
+    Reads, hashes and decodes a texture file. Runs in worker threads, so
+    it must not touch bpy. Returns float RGBA pixels or None.
+    """
+    try:
+        key = get_file_key(filepath)
+        with open(filepath, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+    FILE_HASHES[key] = hashlib.sha1(data).hexdigest()
+
+    rgba = decode_bmp(data)
+    if rgba is None:
+        return None
+    pixels = rgba.astype(np.float32) / 255
+    height, width = pixels.shape[:2]
+    if proxy_factor > 1 and width >= proxy_factor and height >= proxy_factor:
+        pixels = box_filter(pixels, proxy_factor)
+    return pixels
+
+
+def decode_textures(filepaths, proxy_factor=1, workers=None):
+    """ Decodes texture files in a thread pool. Returns {path: pixels} """
+    filepaths = list(dict.fromkeys(filepaths))
+    if len(filepaths) < 2 or workers == 1:
+        return {path: decode_texture(path, proxy_factor) for path in filepaths}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = executor.map(decode_texture, filepaths, [proxy_factor] * len(filepaths))
+        return dict(zip(filepaths, results))
+
+
+def create_image(filepath, pixels, proxy_factor):
+    """ Creates an image from decoded pixels, keeping the file path """
+    height, width = pixels.shape[:2]
+    image = bpy.data.images.new(os.path.basename(filepath), width, height, alpha=True)
+    image.pixels.foreach_set(pixels.ravel())
+    image.filepath_raw = filepath
+    image[DECODED_KEY] = True
+    if proxy_factor > 1:
+        image[PROXY_KEY] = proxy_factor
+    return image
+
+
+def preload_textures(filepaths, proxy_factor=1):
+    """
+    Decodes the given texture files in parallel and creates the images of
+    all files that aren't loaded yet. Files that can't be decoded are left
+    to load_shared_image.
+    """
+    start = time.time()
+    # Files hashed before are checked right away, new ones are hashed by the workers
+    filepaths = [path for path in filepaths if get_file_key(path) not in FILE_HASHES
+                 or IMAGE_INDEX.find(get_content_key(path)) is None]
+    decoded = decode_textures(filepaths, proxy_factor)
+
+    count = 0
+    for filepath, pixels in decoded.items():
+        # Identical files in the same batch are only created once
+        key = get_content_key(filepath)
+        if pixels is None or IMAGE_INDEX.find(key) is not None:
+            continue
+        image = create_image(filepath, pixels, proxy_factor)
+        IMAGE_INDEX.add(image, key)
+        count += 1
+
+    if count:
+        print("Decoded {} textures in {:.3f} seconds.".format(count, time.time() - start))
+
+
+def benchmark_decoding(folder, proxy_factor=1):
+    """
+    Times serial and threaded decoding of all bitmaps of a folder (e.g. a
+    track with many texture pages). Doesn't create any images.
+    """
+    filepaths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                 if name.lower().endswith(".bmp")]
+    timings = {}
+    for label, workers in (("serial", 1), ("threaded", None)):
+        start = time.time()
+        decode_textures(filepaths, proxy_factor, workers)
+        timings[label] = time.time() - start
+    print("Decoded {} bitmaps: {:.3f}s serial, {:.3f}s threaded ({} threads).".format(
+        len(filepaths), timings["serial"], timings["threaded"], os.cpu_count()))
+    return timings
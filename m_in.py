@@ -17,8 +17,10 @@ from .layers import set_face_env
 from . import rvstruct
 from . import img_in
 from . import w_in
+from . import texanim
 from .rvstruct import Model
 from .common import to_blender_coord, to_blender_axis, FACE_QUAD, reverse_quad, FACE_ENV, dprint
+from .tools import assign_materials
 
 # Reload imports if 'bpy' is already in locals
 if "bpy" in locals():
@@ -64,12 +66,11 @@ def import_file(filepath, scene):
             assign_uv_tex_material(obj)
 
     if obj:  # Only proceed if an object was successfully created
-        texture_animations = [animation.as_dict() for animation in model.animations]
-        scene.texture_animations = str(texture_animations)
+        texanim.set_animations(scene, model.animations)
         scene.ta_max_slots = model.animation_count
 
         # Apply material settings for both COL and UV_TEX after importing
-        assign_material_to_all(scene)
+        assign_materials([obj])
     
     return obj
 
@@ -278,40 +279,3 @@ def apply_env_data(mesh_data, world, polygons, envlist, obj_name):
     bm.to_mesh(mesh_data)
     mesh_data.update()
     bm.free()
-    
-def assign_material_to_all(scene):
-    """Assign material to all imported objects for both COL and UV_TEX."""
-    # Get all mesh objects in the scene
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-    
-    # Run texture assignment for both material choices
-    set_material_to_col(mesh_objects)
-    set_material_to_texture(mesh_objects)
-
-def set_material_to_col(mesh_objects):
-    """Sets the material to Vertex Colour (_Col) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'COL'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture(mesh_objects):
-    """Sets the material to Texture (UV_TEX) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'UV_TEX'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
@@ -23,12 +23,13 @@ from . import common
 from . import rvstruct
 from . import img_in
 from . import layers
+from . import texanim
 
 from .common import dprint, get_all_lod, triangulate_ngons, queue_error, FACE_PROP_MASK, FACE_QUAD, texture_to_int, FACE_ENV, to_revolt_coord
 from. common import to_revolt_axis, rvbbox_from_bm, center_from_rvbbox, radius_from_bmesh
 from .layers import *
 from .rvstruct import Model
-from .tools import set_material_to_texture_for_object
+from .tools import assign_materials
 
 
 def export_file(filepath, scene):
@@ -38,12 +39,8 @@ def export_file(filepath, scene):
     # Ensure we're in object mode before any operations
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    # Get all mesh objects in the scene
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-
     # Run material assignment for both COL and UV_TEX
-    set_material_to_col(mesh_objects)
-    set_material_to_texture(mesh_objects)
+    assign_materials([obj])
 
     # Check if other LoDs are present
     meshes = []
@@ -64,11 +61,7 @@ def export_file(filepath, scene):
         export_mesh(me, obj, scene, filepath, model)
 
     # Exports the texture animation
-    animations = eval(scene.texture_animations)
-    for animdict in animations:
-        anim = rvstruct.TexAnimation()
-        anim.from_dict(animdict)
-        model.animations.append(anim)
+    model.animations.extend(texanim.get_animations(scene))
     model.animation_count = scene.ta_max_slots
 
     # Write the single Model instance to the file
@@ -198,31 +191,3 @@ def export_mesh(me, obj, scene, filepath, model):
         model.vertices.append(rvvert)
 
     bm.free()
-    
-def set_material_to_col(mesh_objects):
-    """Sets the material to Vertex Colour (_Col) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'COL'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture(mesh_objects):
-    """Sets the material to Texture (UV_TEX) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'UV_TEX'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
@@ -17,20 +17,24 @@ import shutil
 import bmesh
 import math
 import mathutils
+import numpy as np
 from mathutils import Vector as BlenderVector
 from bpy_extras.io_utils import ExportHelper
 from . import common
 from . import tools
+from . import texatlas
+from . import img_in
+from . import shadow
+from . import vertexbake
 from .fin_in import model_color_material
 from .hul_in import create_sphere
 from .texanim import *
 from .tools import generate_chull
 from .rvstruct import *
-from . import carinfo
 from .common import get_format, FORMAT_PRM, FORMAT_FIN, FORMAT_NCP, FORMAT_HUL, FORMAT_W, FORMAT_M, FORMAT_RIM, FORMAT_TA_CSV
 from .common import FORMAT_TAZ, FORMAT_TRI, FORMAT_UNK
 from .common import get_errors, msg_box, FORMATS, to_revolt_scale, FORMAT_CAR, TEX_PAGES_MAX, int_to_texture
-from .layers import set_face_env, create_or_assign_env_material
+from .layers import set_face_env, create_or_assign_env_material, get_base_name_for_layers
 from .taz_in import create_zone
 from .texanim import copy_frame_to_uv, copy_uv_to_frame
 from .tri_in import create_trigger
@@ -320,7 +324,7 @@ class RVIO_OT_ReadCarParameters(bpy.types.Operator):
             self.report({'ERROR'}, "Please select a valid parameters.txt file")
             return {'CANCELLED'}
 
-        parameters = carinfo.read_parameters(self.filepath)
+        parameters = common.PARAMETERS.get(self.filepath)
         parameters_str = self.format_parameters(parameters)
 
         text_block_name = os.path.basename(self.filepath)
@@ -531,6 +535,9 @@ class TexturesSave(bpy.types.Operator):
             return {'CANCELLED'}
 
         for image in bpy.data.images:
+            # Images decoded by the add-on are saved from their files
+            img_in.use_file_source(image)
+
             # Work only with image files
             if image.source == 'FILE' and image.file_format in ['BMP', 'PNG', 'JPEG', 'TIFF', 'TGA']:  # Extendable for any format
                 base, ext = os.path.splitext(image.name)
@@ -541,6 +548,8 @@ class TexturesSave(bpy.types.Operator):
             
                 # Save the file as BMP
                 try:
+                    # Proxies are saved from the full resolution file
+                    img_in.restore_full_resolution(image)
                     original_path = image.filepath_from_user()
                     image.filepath_raw = dst
                     image.file_format = 'BMP'
@@ -560,6 +569,59 @@ class TexturesSave(bpy.types.Operator):
             return {'CANCELLED'}
         return context.window_manager.invoke_confirm(self, event)
 
+class TexturesPackAtlas(bpy.types.Operator):
+    bl_idname = "helpers.textures_pack_atlas"
+    bl_label = "Pack Texture Pages"
+    bl_description = (
+        "Packs the used regions of all texture pages onto fewer pages and "
+        "remaps the UVs, texture numbers and texture animations"
+    )
+    bl_options = {'REGISTER', 'UNDO'}
+
+    directory: bpy.props.StringProperty(
+        name="Directory",
+        description="Folder to save the new texture pages to. Must not be the folder "
+                    "of the current pages, they are kept",
+        subtype='DIR_PATH'
+    )
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        if not self.directory or not os.path.isdir(self.directory):
+            self.report({'ERROR'}, "Invalid directory.")
+            return {'CANCELLED'}
+
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        try:
+            result = texatlas.pack_texture_pages(context.scene, self.directory)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        if result is None:
+            self.report({'INFO'}, "No texture pages could be packed.")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, "Packed {} texture pages into {}.".format(*result))
+        return {'FINISHED'}
+
+class TexturesFullResolution(bpy.types.Operator):
+    bl_idname = "helpers.textures_full_resolution"
+    bl_label = "Load Full Resolution Textures"
+    bl_description = (
+        "Reloads all reduced preview textures from their original files"
+    )
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        count = sum(img_in.restore_full_resolution(image) for image in bpy.data.images)
+        self.report({'INFO'}, "Loaded {} textures at full resolution.".format(count))
+        return {'FINISHED'}
+
 class TexturesRename(bpy.types.Operator):
     bl_idname = "helpers.texture_rename"
     bl_label = "Rename Texture"
@@ -1026,20 +1088,6 @@ class MaterialAssignmentAuto(bpy.types.Operator):
                 textures[image.name] = name_parts[0]
         return textures
 
-    def get_base_name_for_layers(self, obj):
-        base_name = obj.name.split('.')[0]
-        extension = ""  # Default to no extension
-
-        specific_keywords = ["body", "wheel", "axle", "spring"]
-        filtered_parts = [part for part in obj.name.split('_') if any(keyword in part for keyword in specific_keywords)]
-
-        if ".w" in obj.name:
-            extension = ".w"
-        elif ".prm" in obj.name or ".m" in obj.name or filtered_parts:
-            extension = ".prm" if ".prm" in obj.name else ".m"
-
-        return f"{base_name}{extension}"
-
     def get_texture_base_name(self, tex_num, existing_textures):
         suffix1 = chr(tex_num % 26 + 97)
         suffix2_num = tex_num // 26 - 1
@@ -1132,7 +1180,7 @@ class MaterialAssignmentAuto(bpy.types.Operator):
         print(f"Material assignment completed for {obj.name}.")
 
     def assign_regular_materials(self, obj, material_suffix):
-        base_name = self.get_base_name_for_layers(obj)
+        base_name = tools.get_material_base_name(obj)
 
         # First, try to find materials with the exact base name + material suffix
         prefixed_material_name = f"{base_name}{material_suffix}"
@@ -1234,20 +1282,6 @@ class MaterialAssignment(bpy.types.Operator):
                 textures[image.name] = name_parts[0]
         return textures
 
-    def get_base_name_for_layers(self, obj):
-        base_name = obj.name.split('.')[0]
-        extension = ""  # Default to no extension
-
-        specific_keywords = ["body", "wheel", "axle", "spring"]
-        filtered_parts = [part for part in obj.name.split('_') if any(keyword in part for keyword in specific_keywords)]
-
-        if ".w" in obj.name:
-            extension = ".w"
-        elif ".prm" in obj.name or ".m" in obj.name or filtered_parts:
-            extension = ".prm" if ".prm" in obj.name else ".m"
-
-        return f"{base_name}{extension}"
-
     def get_texture_base_name(self, tex_num, existing_textures):
         suffix1 = chr(tex_num % 26 + 97)
         suffix2_num = tex_num // 26 - 1
@@ -1340,7 +1374,7 @@ class MaterialAssignment(bpy.types.Operator):
         print(f"Material assignment completed for {obj.name}.")
 
     def assign_regular_materials(self, obj, material_suffix):
-        base_name = self.get_base_name_for_layers(obj)
+        base_name = tools.get_material_base_name(obj)
 
         # First, try to find materials with the exact base name + material suffix
         prefixed_material_name = f"{base_name}{material_suffix}"
@@ -1617,12 +1651,22 @@ class BakeShadow(bpy.types.Operator):
         # Set the image node as active for baking
         mat.node_tree.nodes.active = tex_image_node
 
-    def adjust_brightness(self, texture, factor):
-        for i in range(0, len(texture.pixels), 4):
-            for j in range(3):
-                texture.pixels[i + j] = min(texture.pixels[i + j] * factor, 1.0)
+    def get_pixels(self, texture):
+        """Reads the pixels of an image into a (height, width, 4) array."""
+        width, height = texture.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        texture.pixels.foreach_get(pixels)
+        return pixels.reshape(height, width, 4)
+
+    def set_pixels(self, texture, pixels):
+        """Writes a (height, width, 4) array back to an image at once."""
+        texture.pixels.foreach_set(pixels.ravel())
         texture.update()
 
+    def adjust_brightness(self, pixels, factor):
+        np.minimum(pixels[..., :3] * factor, 1.0, out=pixels[..., :3])
+
+    @staticmethod
     def get_brightness_factor(scene):
         # Map the slider value (1-8) to brightness factors from 2.0 to 1.3
         factor_mapping = {
@@ -1637,70 +1681,17 @@ class BakeShadow(bpy.types.Operator):
         }
         return factor_mapping.get(scene.shadow_strength, 1.6)
 
-    def darken_shadow(self, texture, threshold=0.99):
-        for i in range(0, len(texture.pixels), 4):
-            is_shadow_pixel = all(texture.pixels[i + j] < threshold for j in range(3))
-            if is_shadow_pixel:
-                for j in range(3):
-                    texture.pixels[i + j] = 0.0
-        texture.update()
-
-    def invert_shadow(self, texture):
-        for i in range(0, len(texture.pixels), 4):
-            for j in range(3):
-                texture.pixels[i + j] = 1.0 - texture.pixels[i + j]
-        texture.update()
-
-    def blur_texture_edges(self, material, image):
-        """Applies a blur on the shadow edges using a gradient texture with a fixed blur scale."""
-        nodes = material.node_tree.nodes
-        links = material.node_tree.links
-
-        # Clear existing nodes
-        nodes.clear()
-
-        # Add the image texture node (this is the texture being blurred)
-        tex_image_node = nodes.new('ShaderNodeTexImage')
-        tex_image_node.image = image
-
-        # Add a gradient texture for edge softening
-        gradient_node = nodes.new('ShaderNodeTexGradient')
-        gradient_node.gradient_type = 'RADIAL'
-
-        # Add a mapping node to control the gradient scale (fixed blur strength)
-        mapping_node = nodes.new('ShaderNodeMapping')
-        mapping_node.inputs['Scale'].default_value = (1.5, 1.5, 1.5)  # Fixed blur scale, adjust if necessary
-
-        # Add the color ramp to control the blending of black and white
-        color_ramp_node = nodes.new('ShaderNodeValToRGB')
-        color_ramp_node.color_ramp.interpolation = 'LINEAR'
-
-        # Set the black (background) value
-        color_ramp_node.color_ramp.elements[0].position = 0.5  # Adjust as needed
-        color_ramp_node.color_ramp.elements[0].color = (0.0, 0.0, 0.0, 1.0)  # Black
-
-        # Set the white (shadow) value
-        color_ramp_node.color_ramp.elements[1].position = 0.99  # Keep the shadow white
-        color_ramp_node.color_ramp.elements[1].color = (1.0, 1.0, 1.0, 1.0)  # White
+    def darken_shadow(self, pixels, threshold=0.99):
+        is_shadow_pixel = np.all(pixels[..., :3] < threshold, axis=-1)
+        pixels[is_shadow_pixel, :3] = 0.0
 
-        # Add a mix node to blend the shadow and the gradient for softening edges
-        mix_node = nodes.new('ShaderNodeMixRGB')
-        mix_node.blend_type = 'MIX'
-        mix_node.inputs['Fac'].default_value = 1.0  # Full opacity
+    def invert_shadow(self, pixels):
+        pixels[..., :3] = 1.0 - pixels[..., :3]
 
-        # Connect the gradient to the mix shader
-        links.new(mapping_node.outputs['Vector'], gradient_node.inputs['Vector'])
-        links.new(gradient_node.outputs['Color'], color_ramp_node.inputs['Fac'])  # Mask for edges
-
-        # Connect the shadow texture to the mix shader
-        links.new(tex_image_node.outputs['Color'], mix_node.inputs[2])
-
-        # Connect the color ramp to the mix node to ensure the shadow stays white
-        links.new(color_ramp_node.outputs['Color'], mix_node.inputs[1])
-
-        # Connect the final mix to the material output
-        output_node = nodes.new('ShaderNodeOutputMaterial')
-        links.new(mix_node.outputs['Color'], output_node.inputs['Surface'])
+    def blur_shadow_edges(self, pixels):
+        """Softens the shadow edges with a Gaussian blur scaled to the resolution."""
+        sigma = pixels.shape[1] / 256
+        pixels[..., :3] = common.gaussian_blur(pixels[..., :3], sigma)
 
     def bake_and_process(self, context, margin, brightness_factor, darken_threshold, texture_name_suffix, material):
         """Bake and process the texture with given margin and brightness settings."""
@@ -1714,49 +1705,23 @@ class BakeShadow(bpy.types.Operator):
         bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=margin)
         bpy.ops.object.bake(type='AO')
 
+        # Processes the baked pixels in one buffer
+        pixels = self.get_pixels(shadow_tex)
+
         # Adjust brightness
-        self.adjust_brightness(shadow_tex, brightness_factor)
+        self.adjust_brightness(pixels, brightness_factor)
 
         # Darken the shadow based on the threshold
-        self.darken_shadow(shadow_tex, darken_threshold)
+        self.darken_shadow(pixels, darken_threshold)
 
         # Invert the colors
-        self.invert_shadow(shadow_tex)
+        self.invert_shadow(pixels)
 
-        return shadow_tex
-
-    def bake_blurred_texture_to_image(self, context, shadow_plane, material):
-        """Bakes the material with the blur effect to a UV image and assigns it to the shadow plane."""
-        shadow_resolution = int(context.scene.shadow_resolution)
+        # Soften the edges
+        self.blur_shadow_edges(pixels)
 
-        # Create a new image to store the baked blur
-        shadow_image = bpy.data.images.new(name="shadow", width=shadow_resolution, height=shadow_resolution, alpha=True)
-
-        # Ensure the shadow_plane has a UV map
-        if not shadow_plane.data.uv_layers:
-            bpy.ops.mesh.uv_texture_add()
-
-        # Set the new image as active in the material for baking
-        nodes = material.node_tree.nodes
-        links = material.node_tree.links
-
-        # Create the texture image node for baking
-        tex_image_node = nodes.new('ShaderNodeTexImage')
-        tex_image_node.image = shadow_image
-        nodes.active = tex_image_node  # Set the image texture node as active
-
-        # Ensure the shadow plane is the active object
-        context.view_layer.objects.active = shadow_plane
-        shadow_plane.select_set(True)
-
-        # Bake the material to the image (using 'COMBINED' to include all shaders)
-        bpy.ops.object.bake(type='COMBINED')
-
-        # The blurred image will now appear in Blender's texture image list
-        # Assign the baked image to the shadow plane for final output
-        self.assign_final_texture(shadow_plane, shadow_image)
-
-        return shadow_image
+        self.set_pixels(shadow_tex, pixels)
+        return shadow_tex
 
     def assign_final_texture(self, shadow_plane, shadow_tex):
         """Assigns the final baked shadow texture to the shadow plane."""
@@ -1868,18 +1833,9 @@ class BakeShadow(bpy.types.Operator):
         # First bake
         shadow_tex1 = self.bake_and_process(context, margin=0.01, brightness_factor=brightness_factor, darken_threshold=0.99, texture_name_suffix="Bake1", material=mat)
 
-        # Apply edge softening effect
-        self.blur_texture_edges(mat, shadow_tex1)
-        
-        # Assign final texture to ShadowPlane material
+        # The processed bake is the final shadow texture
+        shadow_tex1.name = "shadow"
         self.assign_final_texture(shadow_plane, shadow_tex1)
-
-        # Bake the blurred texture to a UV image and assign it to the shadow plane
-        blurred_texture_image = self.bake_blurred_texture_to_image(context, shadow_plane, mat)
-
-        # **Remove Shadow_bake1 texture after baking**
-        if "Shadow_Bake1" in bpy.data.images:
-            bpy.data.images.remove(bpy.data.images["Shadow_Bake1"])
             
         # Remove ShadowPlane after baking is done
         bpy.data.objects.remove(shadow_plane, do_unlink=True)
@@ -1915,7 +1871,12 @@ class BakeShadow(bpy.types.Operator):
         original_selection = context.selected_objects[:]
 
         # Perform shadow baking
-        self.bake_shadow(context)
+        if context.scene.shadow_engine == 'ANALYTIC':
+            if shadow.bake_shadow(context.scene, context.selected_objects[0]) is None:
+                self.report({'ERROR'}, "The selected object has no faces to cast a shadow.")
+                return {'CANCELLED'}
+        else:
+            self.bake_shadow(context)
     
         # Restore the original selection and active object
         self.restore_selection(context, original_selection, original_active)
@@ -1955,19 +1916,6 @@ class BakeVertex(bpy.types.Operator):
         max=5000
     )
     
-    def get_base_name_for_layers(self, obj):
-        base_name = obj.name.split('.')[0]
-        extension = ""
-
-        specific_parts = ["body", "wheel", "axle", "spring"]
-
-        if ".w" in obj.name:
-            extension = ".w"
-        elif ".prm" in obj.name or any(part in obj.name for part in specific_parts):
-            extension = ".prm"
-
-        return f"{base_name}{extension}"
-
     def execute(self, context):
         scene = context.scene
         obj = context.active_object
@@ -1987,9 +1935,6 @@ class BakeVertex(bpy.types.Operator):
             vc_layer = obj.data.vertex_colors.new(name='Col')
         obj.data.vertex_colors.active = vc_layer
 
-        # Preserve the original vertex colors
-        original_vcols = [loop.color[:] for loop in vc_layer.data]
-
         # Create temporary vertex color layers for baking
         temp_ao_vc_layer = obj.data.vertex_colors.new(name='TempBakeAO')
         temp_direct_vc_layer = obj.data.vertex_colors.new(name='TempBakeDirect')
@@ -2002,7 +1947,7 @@ class BakeVertex(bpy.types.Operator):
         scene.cycles.samples = self.samples
 
         # Ensure the material setup is correct
-        base_name = self.get_base_name_for_layers(obj)
+        base_name = get_base_name_for_layers(obj)[0]
         prefixed_mat_name = f"{base_name}_Col"
         generic_mat_name = "_Col"
 
@@ -2044,30 +1989,9 @@ class BakeVertex(bpy.types.Operator):
         vcol_node.layer_name = temp_direct_vc_layer.name
         bpy.ops.object.bake(type='DIFFUSE', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', pass_filter={'DIRECT'}, target='VERTEX_COLORS')
 
-        # Merge the baked AO and direct lighting with the original colors using bmesh
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
-
-        # Access vertex color layers in bmesh
-        vc_layer_bm = bm.loops.layers.color.get('Col')
-        temp_ao_vc_layer_bm = bm.loops.layers.color.get('TempBakeAO')
-        temp_direct_vc_layer_bm = bm.loops.layers.color.get('TempBakeDirect')
-
-        for face in bm.faces:
-            for loop in face.loops:
-                original_color = loop[vc_layer_bm]
-                ao_color = loop[temp_ao_vc_layer_bm]
-                direct_color = loop[temp_direct_vc_layer_bm]
-                # Blend the original color with the AO shadow and direct lighting
-                blended_color = [
-                    original_color[j] * (1 - self.shadow_strength * (1 - ao_color[j])) + self.light_strength * direct_color[j]
-                    for j in range(3)
-                ]
-                loop[vc_layer_bm] = blended_color + [1.0]
-
-        # Update the mesh
-        bm.to_mesh(obj.data)
-        bm.free()
+        # Merge the baked AO and direct lighting with the original colors
+        tools.blend_baked_colors(obj.data, 'Col', 'TempBakeAO', 'TempBakeDirect',
+                                 self.shadow_strength, self.light_strength)
 
         # Delete the temporary vertex color layers
         obj.data.vertex_colors.remove(temp_ao_vc_layer)
@@ -2091,16 +2015,42 @@ class BakeVertex(bpy.types.Operator):
         wm = context.window_manager
         return wm.invoke_props_dialog(self)
     
-class BatchBakeVertexToEnv(bpy.types.Operator):
-    """Batch Bake lighting to vertex colors and apply changes to the _Env material."""
-    bl_idname = "object.batch_bake_vertex_to_env"
-    bl_label = "Batch Bake Light to Vertex Color for _Env"
+class BakeVertexCPU(bpy.types.Operator):
+    """Bake ambient occlusion and the scene lights to vertex colors on the CPU without Cycles."""
+    bl_idname = "object.bake_vertex_cpu"
+    bl_label = "Bake Light to Vertex Color (CPU)"
     bl_options = {'REGISTER', 'UNDO'}
-    
+
+    target: bpy.props.EnumProperty(
+        name="Target",
+        description="Vertex color layer to bake to",
+        items=[
+            ('Col', "Vertex Color", "Bake to the Col layer"),
+            ('Env', "Environment", "Bake to the Env layer (keeps the alpha)"),
+        ],
+        default='Col'
+    )
+
+    samples: bpy.props.IntProperty(
+        name="AO Samples",
+        description="Number of ambient occlusion rays per vertex",
+        default=16,
+        min=1,
+        max=256
+    )
+
+    distance: bpy.props.FloatProperty(
+        name="AO Distance",
+        description="Distance up to which faces occlude each other",
+        default=1.0,
+        min=0.01,
+        max=100.0
+    )
+
     shadow_strength: bpy.props.FloatProperty(
         name="Shadow Strength",
         description="Strength of the shadows",
-        default=5.0,
+        default=1.0,
         min=0.0,
         max=10.0
     )
@@ -2112,138 +2062,169 @@ class BatchBakeVertexToEnv(bpy.types.Operator):
         min=0.0,
         max=10.0
     )
-    
-    samples: bpy.props.IntProperty(
-        name="Samples",
-        description="Number of samples for baking",
-        default=512,
-        min=1,
-        max=5000
-    )
-    
-    def get_base_name_for_layers(self, obj):
-        base_name = obj.name.split('.')[0]
-        extension = ""
-
-        specific_parts = ["body", "wheel", "axle", "spring"]
-
-        if ".w" in obj.name:
-            extension = ".w"
-        elif ".prm" in obj.name or any(part in obj.name for part in specific_parts):
-            extension = ".prm"
-
-        return f"{base_name}{extension}"
-
-    def batch_bake(self, context):
-        scene = context.scene
-
-        # Set render engine to Cycles and configure settings
-        original_engine = scene.render.engine
-        scene.render.engine = 'CYCLES'
-        original_samples = scene.cycles.samples
-        scene.cycles.samples = self.samples
 
-        # Bakes all selected objects
-        for obj in context.selected_objects:
-            # Skips unsupported objects
-            if not hasattr(obj.data, "vertex_colors") or not obj.get('is_instance'):
-                continue
+    def execute(self, context):
+        objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        if not objects:
+            self.report({'WARNING'}, "No mesh objects selected")
+            return {'CANCELLED'}
 
-            print(f"Baking at {obj.name}...")
-            context.view_layer.objects.active = obj
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
 
-            # Ensure the object has a vertex color layer named 'Env'
-            env_layer = obj.data.vertex_colors.get('Env')
-            if not env_layer:
-                env_layer = obj.data.vertex_colors.new(name='Env')
-            obj.data.vertex_colors.active = env_layer
+        start = time.time()
+        num_baked = vertexbake.bake_objects(
+            context.scene, objects, self.target, self.samples, self.distance,
+            self.shadow_strength, self.light_strength
+        )
+        self.report({'INFO'}, "Baked {} vertices in {:.2f} seconds".format(num_baked, time.time() - start))
+        return {'FINISHED'}
 
-            # Preserve the original vertex colors
-            original_vcols = [loop.color[:] for loop in env_layer.data]
+    def invoke(self, context, event):
+        wm = context.window_manager
+        return wm.invoke_props_dialog(self)
 
-            # Create temporary vertex color layers for baking
-            temp_ao_env_layer = obj.data.vertex_colors.new(name='TempBakeAO')
-            temp_direct_env_layer = obj.data.vertex_colors.new(name='TempBakeDirect')
-            obj.data.vertex_colors.active = temp_ao_env_layer
+def batch_bake_vertex_layer(operator, context, layer_name):
+    """
+    Bakes AO and direct light into a vertex color layer of the selected
+    instances. Cycles and every material are set up once, meshes shared by
+    linked duplicates are only baked once. Returns the number of meshes.
+    """
+    scene = context.scene
+    start = time.time()
+
+    # Groups the instances by mesh, linked duplicates share the bake
+    meshes = {}
+    for obj in context.selected_objects:
+        # Skips unsupported objects
+        if not hasattr(obj.data, "vertex_colors") or not obj.get('is_instance'):
+            continue
+        meshes.setdefault(obj.data.name, []).append(obj)
+    if not meshes:
+        return 0
+
+    if context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
 
-            # Ensure the material setup is correct
-            base_name = self.get_base_name_for_layers(obj)
-            prefixed_mat_name = f"{base_name}_Env"
-            generic_mat_name = "_Env"
+    # Set render engine to Cycles and configure settings
+    original_engine = scene.render.engine
+    scene.render.engine = 'CYCLES'
+    original_samples = scene.cycles.samples
+    scene.cycles.samples = operator.samples
 
-            material = bpy.data.materials.get(prefixed_mat_name) or bpy.data.materials.get(generic_mat_name)
-            if not material:
-                self.report({'WARNING'}, f"Material {prefixed_mat_name} or {generic_mat_name} not found.")
-                continue
+    prepared_materials = set()
+    num_baked = 0
+    for instances in meshes.values():
+        obj = instances[0]
+        me = obj.data
+        bake_start = time.time()
 
-            # Ensure material is in object material slot
-            if material.name not in obj.data.materials:
-                obj.data.materials.append(material)
+        # Ensure the material setup is correct
+        base_name = get_base_name_for_layers(obj)[0]
+        prefixed_mat_name = f"{base_name}_{layer_name}"
+        generic_mat_name = f"_{layer_name}"
+        material = bpy.data.materials.get(prefixed_mat_name) or bpy.data.materials.get(generic_mat_name)
+        if not material:
+            operator.report({'WARNING'}, f"Material {prefixed_mat_name} or {generic_mat_name} not found.")
+            continue
 
-            # Prepare vertex color material node setup with Principled BSDF
-            if not material.use_nodes:
-                material.use_nodes = True
+        # Prepare vertex color material node setup with Principled BSDF, once per material
+        if material.name not in prepared_materials:
+            material.use_nodes = True
             nodes = material.node_tree.nodes
             links = material.node_tree.links
             nodes.clear()
             vcol_node = nodes.new(type='ShaderNodeVertexColor')
-            vcol_node.layer_name = 'Env'
+            vcol_node.layer_name = layer_name
             bsdf_node = nodes.new(type='ShaderNodeBsdfPrincipled')
             output_node = nodes.new(type='ShaderNodeOutputMaterial')
             links.new(vcol_node.outputs['Color'], bsdf_node.inputs['Base Color'])
             links.new(bsdf_node.outputs['BSDF'], output_node.inputs['Surface'])
+            prepared_materials.add(material.name)
 
-            # Ensure the active mesh object is selected
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.select_all(action='DESELECT')
-            obj.select_set(True)
-            bpy.ops.object.mode_set(mode='OBJECT')
+        # Ensure material is in object material slot
+        if material.name not in me.materials:
+            me.materials.append(material)
 
-            # Bake the ambient occlusion (AO) to the temporary vertex color layer
-            bpy.ops.object.bake(type='AO', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', target='VERTEX_COLORS')
+        # Ensure the object has the vertex color layer
+        if not me.vertex_colors.get(layer_name):
+            me.vertex_colors.new(name=layer_name)
 
-            # Switch to the temporary direct lighting vertex color layer
-            obj.data.vertex_colors.active = temp_direct_env_layer
+        # Create temporary vertex color layers for baking
+        temp_ao_layer = me.vertex_colors.new(name='TempBakeAO')
+        temp_direct_layer = me.vertex_colors.new(name='TempBakeDirect')
 
-            # Bake the direct lighting to the temporary vertex color layer
-            bpy.ops.object.bake(type='DIFFUSE', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', pass_filter={'DIRECT'}, target='VERTEX_COLORS')
+        obj.select_set(True)
+        context.view_layer.objects.active = obj
 
-            # Merge the baked AO and direct lighting with the original colors using bmesh
-            bm = bmesh.new()
-            bm.from_mesh(obj.data)
+        # Bake the ambient occlusion (AO) to the temporary vertex color layer
+        me.vertex_colors.active = temp_ao_layer
+        bpy.ops.object.bake(type='AO', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', target='VERTEX_COLORS')
 
-            # Access vertex color layers in bmesh
-            env_layer_bm = bm.loops.layers.color.get('Env')
-            temp_ao_env_layer_bm = bm.loops.layers.color.get('TempBakeAO')
-            temp_direct_env_layer_bm = bm.loops.layers.color.get('TempBakeDirect')
+        # Bake the direct lighting to the temporary vertex color layer
+        me.vertex_colors.active = temp_direct_layer
+        bpy.ops.object.bake(type='DIFFUSE', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', pass_filter={'DIRECT'}, target='VERTEX_COLORS')
 
-            for face in bm.faces:
-                for loop in face.loops:
-                    original_color = loop[env_layer_bm]
-                    ao_color = loop[temp_ao_env_layer_bm]
-                    direct_color = loop[temp_direct_env_layer_bm]
-                    # Blend the original color with the AO shadow and direct lighting
-                    blended_color = [
-                        original_color[j] * (1 - self.shadow_strength * (1 - ao_color[j])) + self.light_strength * direct_color[j]
-                        for j in range(3)
-                    ]
-                    loop[env_layer_bm] = blended_color + [original_color[3]]  # Preserve original alpha value
+        obj.select_set(False)
 
-            # Update the mesh
-            bm.to_mesh(obj.data)
-            bm.free()
+        # Merge the baked AO and direct lighting with the original colors
+        tools.blend_baked_colors(me, layer_name, 'TempBakeAO', 'TempBakeDirect',
+                                 operator.shadow_strength, operator.light_strength,
+                                 keep_alpha=layer_name == 'Env')
 
-            # Delete the temporary vertex color layers
-            obj.data.vertex_colors.remove(temp_ao_env_layer)
-            obj.data.vertex_colors.remove(temp_direct_env_layer)
+        # Delete the temporary vertex color layers
+        me.vertex_colors.remove(temp_ao_layer)
+        me.vertex_colors.remove(temp_direct_layer)
+        me.vertex_colors.active = me.vertex_colors.get(layer_name)
 
-        # Cleanup and restore settings
-        scene.render.engine = original_engine
-        scene.cycles.samples = original_samples
+        num_baked += 1
+        shared = f" (shared by {len(instances)} objects)" if len(instances) > 1 else ""
+        print(f"Baked {obj.name}{shared} in {time.time() - bake_start:.2f} seconds.")
+
+    # Cleanup and restore settings
+    scene.render.engine = original_engine
+    scene.cycles.samples = original_samples
+
+    print(f"Baked {num_baked} meshes in {time.time() - start:.2f} seconds.")
+    return num_baked
+
+class BatchBakeVertexToEnv(bpy.types.Operator):
+    """Batch Bake lighting to vertex colors and apply changes to the _Env material."""
+    bl_idname = "object.batch_bake_vertex_to_env"
+    bl_label = "Batch Bake Light to Vertex Color for _Env"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    shadow_strength: bpy.props.FloatProperty(
+        name="Shadow Strength",
+        description="Strength of the shadows",
+        default=5.0,
+        min=0.0,
+        max=10.0
+    )
+
+    light_strength: bpy.props.FloatProperty(
+        name="Light Strength",
+        description="Strength of the light rays",
+        default=0.5,
+        min=0.0,
+        max=10.0
+    )
+    
+    samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Number of samples for baking",
+        default=512,
+        min=1,
+        max=5000
+    )
+    
+    def batch_bake(self, context):
+        return batch_bake_vertex_layer(self, context, 'Env')
 
     def execute(self, context):
-        self.batch_bake(context)
-        self.report({'INFO'}, "Batch baking completed successfully")
+        num_baked = self.batch_bake(context)
+        self.report({'INFO'}, f"Batch baking completed successfully ({num_baked} meshes)")
         return {'FINISHED'}
     
     def invoke(self, context, event):
@@ -2280,129 +2261,12 @@ class BakeVertexToRGBModelColor(bpy.types.Operator):
         max=5000
     )
     
-    def get_base_name_for_layers(self, obj):
-        base_name = obj.name.split('.')[0]
-        extension = ""
-
-        specific_parts = ["body", "wheel", "axle", "spring"]
-
-        if ".w" in obj.name:
-            extension = ".w"
-        elif ".prm" in obj.name or any(part in obj.name for part in specific_parts):
-            extension = ".prm"
-
-        return f"{base_name}{extension}"
-
     def batch_bake(self, context):
-        scene = context.scene
-
-        # Set render engine to Cycles and configure settings
-        original_engine = scene.render.engine
-        scene.render.engine = 'CYCLES'
-        original_samples = scene.cycles.samples
-        scene.cycles.samples = self.samples
-
-        # Bakes all selected objects
-        for obj in context.selected_objects:
-            # Skips unsupported objects
-            if not hasattr(obj.data, "vertex_colors") or not obj.get('is_instance'):
-                continue
-
-            print(f"Baking at {obj.name}...")
-            context.view_layer.objects.active = obj
-
-            # Ensure the object has a vertex color layer named 'RGBModelColor'
-            rgb_layer = obj.data.vertex_colors.get('RGBModelColor')
-            if not rgb_layer:
-                rgb_layer = obj.data.vertex_colors.new(name='RGBModelColor')
-            obj.data.vertex_colors.active = rgb_layer
-
-            # Preserve the original vertex colors
-            original_vcols = [loop.color[:] for loop in rgb_layer.data]
-
-            # Create temporary vertex color layers for baking
-            temp_ao_rgb_layer = obj.data.vertex_colors.new(name='TempBakeAO')
-            temp_direct_rgb_layer = obj.data.vertex_colors.new(name='TempBakeDirect')
-            obj.data.vertex_colors.active = temp_ao_rgb_layer
-
-            # Ensure the material setup is correct
-            base_name = self.get_base_name_for_layers(obj)
-            prefixed_mat_name = f"{base_name}_RGBModelColor"
-            generic_mat_name = "_RGBModelColor"
-
-            material = bpy.data.materials.get(prefixed_mat_name) or bpy.data.materials.get(generic_mat_name)
-            if not material:
-                self.report({'WARNING'}, f"Material {prefixed_mat_name} or {generic_mat_name} not found.")
-                continue
-
-            # Ensure material is in object material slot
-            if material.name not in obj.data.materials:
-                obj.data.materials.append(material)
-
-            # Prepare vertex color material node setup with Principled BSDF
-            if not material.use_nodes:
-                material.use_nodes = True
-            nodes = material.node_tree.nodes
-            links = material.node_tree.links
-            nodes.clear()
-            vcol_node = nodes.new(type='ShaderNodeVertexColor')
-            vcol_node.layer_name = 'RGBModelColor'
-            bsdf_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-            output_node = nodes.new(type='ShaderNodeOutputMaterial')
-            links.new(vcol_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-            links.new(bsdf_node.outputs['BSDF'], output_node.inputs['Surface'])
-
-            # Ensure the active mesh object is selected
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.select_all(action='DESELECT')
-            obj.select_set(True)
-            bpy.ops.object.mode_set(mode='OBJECT')
-
-            # Bake the ambient occlusion (AO) to the temporary vertex color layer
-            bpy.ops.object.bake(type='AO', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', target='VERTEX_COLORS')
-
-            # Switch to the temporary direct lighting vertex color layer
-            obj.data.vertex_colors.active = temp_direct_rgb_layer
-
-            # Bake the direct lighting to the temporary vertex color layer
-            bpy.ops.object.bake(type='DIFFUSE', use_clear=True, use_selected_to_active=False, margin=2, cage_extrusion=0.0, normal_space='TANGENT', pass_filter={'DIRECT'}, target='VERTEX_COLORS')
-
-            # Merge the baked AO and direct lighting with the original colors using bmesh
-            bm = bmesh.new()
-            bm.from_mesh(obj.data)
-
-            # Access vertex color layers in bmesh
-            rgb_layer_bm = bm.loops.layers.color.get('RGBModelColor')
-            temp_ao_rgb_layer_bm = bm.loops.layers.color.get('TempBakeAO')
-            temp_direct_rgb_layer_bm = bm.loops.layers.color.get('TempBakeDirect')
-
-            for face in bm.faces:
-                for loop in face.loops:
-                    original_color = loop[rgb_layer_bm]
-                    ao_color = loop[temp_ao_rgb_layer_bm]
-                    direct_color = loop[temp_direct_rgb_layer_bm]
-                    # Blend the original color with the AO shadow and direct lighting
-                    blended_color = [
-                        original_color[j] * (1 - self.shadow_strength * (1 - ao_color[j])) + self.light_strength * direct_color[j]
-                        for j in range(3)
-                    ]
-                    loop[rgb_layer_bm] = blended_color + [1.0]  # Add alpha value for RGBModelColor
-
-            # Update the mesh
-            bm.to_mesh(obj.data)
-            bm.free()
-
-            # Delete the temporary vertex color layers
-            obj.data.vertex_colors.remove(temp_ao_rgb_layer)
-            obj.data.vertex_colors.remove(temp_direct_rgb_layer)
-
-        # Cleanup and restore settings
-        scene.render.engine = original_engine
-        scene.cycles.samples = original_samples
+        return batch_bake_vertex_layer(self, context, 'RGBModelColor')
 
     def execute(self, context):
-        self.batch_bake(context)
-        self.report({'INFO'}, "Batch baking completed successfully")
+        num_baked = self.batch_bake(context)
+        self.report({'INFO'}, f"Batch baking completed successfully ({num_baked} meshes)")
         return {'FINISHED'}
     
     def invoke(self, context, event):
@@ -2488,10 +2352,10 @@ class TexAnimTransform(bpy.types.Operator):
             msg_box("Slot limit is 0. Please increase the slot limit before creating an animation.", "ERROR")
             return {'FINISHED'}
 
-        ta = eval(scene.texture_animations)
+        slots = get_slots(scene)
         slot = scene.ta_current_slot
 
-        if slot >= len(ta):
+        if slot >= len(slots):
             msg_box("Slot index out of range.", "ERROR")
             return {'FINISHED'}
 
@@ -2503,45 +2367,23 @@ class TexAnimTransform(bpy.types.Operator):
             msg_box("Frame index out of range.", "ERROR")
             return {'FINISHED'}
 
-        uv_start = (
-            (ta[slot]["frames"][frame_start]["uv"][0]["u"],
-             ta[slot]["frames"][frame_start]["uv"][0]["v"]),
-            (ta[slot]["frames"][frame_start]["uv"][1]["u"],
-             ta[slot]["frames"][frame_start]["uv"][1]["v"]),
-            (ta[slot]["frames"][frame_start]["uv"][2]["u"],
-             ta[slot]["frames"][frame_start]["uv"][2]["v"]),
-            (ta[slot]["frames"][frame_start]["uv"][3]["u"],
-             ta[slot]["frames"][frame_start]["uv"][3]["v"])
-        )
-
-        uv_end = (
-            (ta[slot]["frames"][frame_end]["uv"][0]["u"],
-             ta[slot]["frames"][frame_end]["uv"][0]["v"]),
-            (ta[slot]["frames"][frame_end]["uv"][1]["u"],
-             ta[slot]["frames"][frame_end]["uv"][1]["v"]),
-            (ta[slot]["frames"][frame_end]["uv"][2]["u"],
-             ta[slot]["frames"][frame_end]["uv"][2]["v"]),
-            (ta[slot]["frames"][frame_end]["uv"][3]["u"],
-             ta[slot]["frames"][frame_end]["uv"][3]["v"])
-        )
+        frames = slots[slot].frames
+        uv_start = [(uv.u, uv.v) for uv in frames[frame_start].uv]
+        uv_end = [(uv.u, uv.v) for uv in frames[frame_end].uv]
 
         nframes = abs(frame_end - frame_start) + 1
 
         for i in range(0, nframes):
-            current_frame = frame_start + i
+            frame = frames[frame_start + i]
             prog = i / (frame_end - frame_start)
 
-            ta[slot]["frames"][frame_start + i]["delay"] = scene.ta_delay
-            ta[slot]["frames"][frame_start + i]["texture"] = scene.ta_texture
+            frame.delay = scene.ta_delay
+            frame.texture = scene.ta_texture
 
             for j in range(0, 4):
-                new_u = uv_start[j][0] * (1 - prog) + uv_end[j][0] * prog
-                new_v = uv_start[j][1] * (1 - prog) + uv_end[j][1] * prog
-
-                ta[slot]["frames"][frame_start + i]["uv"][j]["u"] = new_u
-                ta[slot]["frames"][frame_start + i]["uv"][j]["v"] = new_v
+                frame.uv[j].u = uv_start[j][0] * (1 - prog) + uv_end[j][0] * prog
+                frame.uv[j].v = uv_start[j][1] * (1 - prog) + uv_end[j][1] * prog
 
-        scene.texture_animations = str(ta)
         update_ta_current_frame(self, context)
 
         msg_box("Animation from frame {} to {} completed.".format(
@@ -2564,7 +2406,7 @@ class TexAnimGrid(bpy.types.Operator):
             msg_box("Slot limit is 0. Please increase the slot limit before creating a grid animation.", "ERROR")
             return {'FINISHED'}
 
-        ta = eval(scene.texture_animations)
+        slots = get_slots(scene)
         slot = scene.ta_current_slot
         max_frames = scene.ta_max_frames
 
@@ -2590,21 +2432,16 @@ class TexAnimGrid(bpy.types.Operator):
                 uv2 = ((x+1)/grid_x, (y+1)/grid_y)
                 uv3 = (x/grid_x, (y+1)/grid_y)
 
-                ta[slot]["frames"][frame_start + i]["delay"] = scene.ta_delay
-                ta[slot]["frames"][frame_start + i]["texture"] = scene.ta_texture
+                frame = slots[slot].frames[frame_start + i]
+                frame.delay = scene.ta_delay
+                frame.texture = scene.ta_texture
 
-                ta[slot]["frames"][frame_start + i]["uv"][0]["u"] = uv0[0]
-                ta[slot]["frames"][frame_start + i]["uv"][0]["v"] = uv0[1]
-                ta[slot]["frames"][frame_start + i]["uv"][1]["u"] = uv1[0]
-                ta[slot]["frames"][frame_start + i]["uv"][1]["v"] = uv1[1]
-                ta[slot]["frames"][frame_start + i]["uv"][2]["u"] = uv2[0]
-                ta[slot]["frames"][frame_start + i]["uv"][2]["v"] = uv2[1]
-                ta[slot]["frames"][frame_start + i]["uv"][3]["u"] = uv3[0]
-                ta[slot]["frames"][frame_start + i]["uv"][3]["v"] = uv3[1]
+                for uv, (u, v) in zip(frame.uv, (uv0, uv1, uv2, uv3)):
+                    uv.u = u
+                    uv.v = v
 
                 i += 1
 
-        scene.texture_animations = str(ta)
         update_ta_current_frame(self, context)
 
         msg_box("Animation of {} frames completed.".format(
@@ -9,6 +9,7 @@ from mathutils import Vector, Quaternion, Matrix, Euler
 from . import common
 from . import carinfo
 from . import prm_in
+from . import img_in
 from .common import to_blender_axis, to_blender_coord, to_blender_scale, PARAMETERS, to_blender_angle
 from .prm_in import import_file
 
@@ -17,22 +18,22 @@ if "bpy" in locals():
     importlib.reload(common)
     importlib.reload(carinfo)
     importlib.reload(prm_in)
+    importlib.reload(img_in)
 
 def import_file(filepath, scene):
     """
     Imports a parameters.txt file and loads car body and wheels.
     """
-    PARAMETERS[filepath] = carinfo.read_parameters(filepath)
     # Extract the car name directly from the parameters.txt file
-    import_car(PARAMETERS[filepath], filepath, scene)
-    PARAMETERS.pop(filepath)
+    import_car(PARAMETERS.get(filepath), filepath, scene)
 
 def import_car(params, filepath, scene):
     folder = os.sep.join(filepath.split(os.sep)[:-1])
     imported_objects = []  # List to keep track of all imported objects
 
     # Import all textures with car name appended
-    import_all_textures(folder)
+    import_all_textures(folder, img_in.get_proxy_factor(scene))
+    img_in.report_shared_images()
     
     body = params["model"][params["body"]["modelnum"]]
     body_loc = to_blender_coord(params["body"]["offset"])
@@ -115,12 +116,20 @@ def import_car(params, filepath, scene):
     
         return None
 
+    # Models imported by this car, the same wheel or spring file used by
+    # several slots is only imported once and linked to the other slots
+    model_cache = {}
+
     def import_or_placeholder(path, name, obj_location):
-        if path:
+        if path in model_cache:
+            obj = get_linked_duplicate(model_cache[path])
+            print(f"Reusing {os.path.basename(path)} for {name}.")
+        elif path:
             obj = prm_in.import_file(path, bpy.context.scene)
             if obj is None:
                 print(f"Error: Failed to import file from path '{path}' for {name}.")
-                pass
+            else:
+                model_cache[path] = obj
         else:
             print(f"Path is None for {name}.")
             pass
@@ -245,6 +254,17 @@ def import_car(params, filepath, scene):
 
     return imported_objects
 
+def get_linked_duplicate(obj):
+    """
+    Copies an imported model object. The copy shares the mesh and
+    materials and starts without the transform of the original.
+    """
+    dup = obj.copy()
+    dup.parent = None
+    dup.matrix_basis = Matrix()
+    bpy.context.scene.collection.objects.link(dup)
+    return dup
+
 def extract_car_name(filepath):
     """
     Reads the car name from the parameters.txt file.
@@ -256,20 +276,24 @@ def extract_car_name(filepath):
                 return line.split('\"')[1].strip()  # Get the text between the quotes
     return "Unknown Car"  # Default if not found
     
-def import_all_textures(folder):
+def import_all_textures(folder, proxy_factor=1):
     """
     Import all .bmp files in the given folder as textures without appending car name.
     """
+    img_in.preload_textures([os.path.join(folder, image_file) for image_file in os.listdir(folder)
+                             if image_file.lower().endswith('.bmp')], proxy_factor)
     for image_file in os.listdir(folder):
         if image_file.lower().endswith('.bmp'):
             img_path = os.path.join(folder, image_file)
             img_name = os.path.splitext(image_file)[0]
 
-            # Import texture without appending car name
+            # Import texture without appending car name, identical bitmaps
+            # of other cars are shared
             if img_name not in bpy.data.images:
-                img = bpy.data.images.load(img_path)
-                img.name = img_name  # Use the original name
-                print(f"Imported texture: {img_name}")
+                img = img_in.load_shared_image(img_path, proxy_factor)
+                if img.filepath == img_path:
+                    img.name = img_name  # Use the original name
+                    print(f"Imported texture: {img_name}")
                 
 def apply_uv_maps_to_textures(obj):
     """
@@ -19,6 +19,7 @@ from . import img_in
 from . import w_in
 from .rvstruct import PRM
 from .common import to_blender_coord, to_blender_axis, FACE_QUAD, reverse_quad, FACE_ENV, dprint
+from .tools import assign_materials, get_slot_index
 
 # Reload imports if 'bpy' is already in locals
 if "bpy" in locals():
@@ -32,7 +33,28 @@ def import_file(filepath, scene):
     It also imports all LoDs of a PRM file, which can be sequentially written
     to the file. There is no indicator for it, the file end has to be checked.
     """
-    meshes = []
+    filename = os.path.basename(filepath)
+    meshes = import_meshes(filepath, scene)
+
+    dprint("Creating Blender object for {}...".format(filename))
+
+    obj = bpy.data.objects.new(filename, meshes[0])
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    assign_uv_tex_material(obj)
+    
+    # Assign materials after importing
+    assign_materials([obj])
+    img_in.report_shared_images()
+    
+    return obj
+
+def import_meshes(filepath, scene):
+    """
+    Decodes a .prm file and builds a Blender mesh for every LoD it contains
+    without creating any objects. The first mesh is the highest quality one.
+    """
+    prms = []
 
     with open(filepath, 'rb') as file:
         filename = os.path.basename(filepath)
@@ -41,33 +63,35 @@ def import_file(filepath, scene):
         file.seek(0, os.SEEK_SET)
 
         while file.tell() < file_end:
-            meshes.append(PRM(file))
+            prms.append(PRM(file))
 
-    dprint(f"Imported {filename} ({len(meshes)} meshes)")
+    dprint(f"Imported {filename} ({len(prms)} meshes)")
+    preload_mesh_textures(prms, filepath, scene)
 
-    for index, prm in enumerate(meshes):
+    meshes = []
+    for index, prm in enumerate(prms):
         me = import_prm_mesh(prm, filename, filepath, scene)
         
-        if len(meshes) > 1:
+        if len(prms) > 1:
             # Fake user if there are multiple LoDs so they're kept when saving
             me.use_fake_user = True
 
             # Append a quality suffix to meshes
             bname, number = me.name.rsplit(".", 1)
-            me.name = "{}|q{}".format(bname, meshes.index(prm))
-            
-        if meshes.index(prm) == 0:
-            dprint("Creating Blender object for {}...".format(filename))
-            
-            obj = bpy.data.objects.new(filename, me)
-            bpy.context.scene.collection.objects.link(obj)
-            bpy.context.view_layer.objects.active = obj
-            assign_uv_tex_material(obj)
-    
-    # Assign materials after importing
-    assign_material_to_all(scene)
-    
-    return obj
+            me.name = "{}|q{}".format(bname, index)
+
+        meshes.append(me)
+
+    return meshes
+
+def preload_mesh_textures(meshes, filepath, scene):
+    """ Decodes the texture pages used by the meshes in parallel """
+    from .common import get_texture_path
+
+    tex_nums = {poly.texture for mesh in meshes for poly in mesh.polygons if poly.texture >= 0}
+    texture_paths = [get_texture_path(filepath, tex_num, scene) for tex_num in sorted(tex_nums)]
+    texture_paths = [path for path in texture_paths if path and os.path.isfile(path)]
+    img_in.preload_textures(texture_paths, img_in.get_proxy_factor(scene))
 
 def import_prm_mesh(prm, filename, filepath, scene, envlist=None):
     me = bpy.data.meshes.new(name=filename)
@@ -104,6 +128,7 @@ def add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist=None):
     texnum_layer = bm.faces.layers.int.new("Texture Number")
     type_layer = bm.faces.layers.int.new("Type")
     created_faces = []
+    texture_materials = {}
 
     for vert in prm.vertices:
         position = to_blender_coord(vert.position.data)
@@ -127,21 +152,17 @@ def add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist=None):
             continue
 
         if poly.texture >= 0:
-            texture_path = get_texture_path(filepath, poly.texture, scene)
-            if texture_path and os.path.isfile(texture_path):
-                material_name = os.path.basename(texture_path)
-                material = bpy.data.materials.get(material_name)
-                if not material:
-                    image = bpy.data.images.load(texture_path, check_existing=True)
-                    material = bpy.data.materials.new(name=material_name)
-                    material.use_nodes = True
-                    bsdf = material.node_tree.nodes.get('Principled BSDF')
-                    tex_image = material.node_tree.nodes.new('ShaderNodeTexImage')
-                    tex_image.image = image
-                    material.node_tree.links.new(bsdf.inputs['Base Color'], tex_image.outputs['Color'])
-                if material_name not in me.materials:
-                    me.materials.append(material)
-                face.material_index = me.materials.find(material_name)
+            # Resolves each texture page once per mesh
+            if poly.texture not in texture_materials:
+                texture_path = get_texture_path(filepath, poly.texture, scene)
+                if texture_path and os.path.isfile(texture_path):
+                    texture_materials[poly.texture] = img_in.get_texture_material(
+                        texture_path, img_in.get_proxy_factor(scene))
+                else:
+                    texture_materials[poly.texture] = None
+            material = texture_materials[poly.texture]
+            if material:
+                face.material_index = get_slot_index(me, material)
 
         face[type_layer] = poly.type
         face[texnum_layer] = poly.texture
@@ -287,40 +308,3 @@ def apply_env_data(mesh_data, world, polygons, envlist, obj_name):
     bm.to_mesh(mesh_data)
     mesh_data.update()
     bm.free()
-    
-def assign_material_to_all(scene):
-    """Assign material to all imported objects for both COL and UV_TEX."""
-    # Get all mesh objects in the scene
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-    
-    # Run texture assignment for both material choices
-    set_material_to_col(mesh_objects)
-    set_material_to_texture(mesh_objects)
-
-def set_material_to_col(mesh_objects):
-    """Sets the material to Vertex Colour (_Col) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'COL'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture(mesh_objects):
-    """Sets the material to Texture (UV_TEX) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'UV_TEX'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
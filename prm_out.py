@@ -18,6 +18,10 @@ if "bpy" in locals():
 import os
 import bpy
 import bmesh
+import collections
+import heapq
+import itertools
+import numpy as np
 from mathutils import Color, Vector, Matrix
 from . import common
 from . import rvstruct
@@ -25,9 +29,31 @@ from . import img_in
 from . import layers
 
 from .common import dprint, get_all_lod, triangulate_ngons, queue_error, FACE_QUAD, FACE_PROP_MASK, texture_to_int, FACE_ENV
-from .common import to_revolt_coord, to_revolt_axis, rvbbox_from_bm, center_from_rvbbox, radius_from_bmesh
+from .common import FACE_STATE_MASK
+from .common import to_revolt_coord, to_revolt_axis, rvbbox_from_bm, center_from_rvbbox, bounding_sphere, SCALE
 from .layers import *
-from .tools import set_material_to_texture_for_object
+from .tools import assign_materials
+
+# Binary layouts of rvstruct.Polygon and rvstruct.Vertex for the array export
+POLYGON_DTYPE = np.dtype([
+    ("type", "<i2"),
+    ("texture", "<i2"),
+    ("vertex_indices", "<u2", 4),
+    ("colors", "u1", (4, 4)),       # B, G, R, alpha
+    ("uv", "<f4", (4, 2)),
+])
+
+VERTEX_DTYPE = np.dtype([
+    ("position", "<f4", 3),
+    ("normal", "<f4", 3),
+])
+
+# Entries of the vertex cache model used for ordering polygons
+VERTEX_CACHE_SIZE = 32
+
+# Loop order of the RV vertex indices (reversed), the 4th tri index is unused
+QUAD_ORDER = np.array([3, 2, 1, 0])
+TRI_ORDER = np.array([2, 1, 0, 0])
 
 
 def export_file(filepath, scene):
@@ -38,12 +64,8 @@ def export_file(filepath, scene):
     # Ensure we're in object mode before any operations
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    # Get all mesh objects in the scene
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-
     # Run material assignment for both COL and UV_TEX
-    set_material_to_col(mesh_objects)
-    set_material_to_texture(mesh_objects)
+    assign_materials([obj])
 
     # Checks if other LoDs are present
     if "|q" in obj.data.name:
@@ -54,6 +76,11 @@ def export_file(filepath, scene):
         dprint("No LOD present.")
         meshes.append(obj.data)
 
+    # Generates reduced LoDs if there are no hand-made ones
+    lods = []
+    if len(meshes) == 1 and getattr(scene, "prm_generate_lods", False):
+        lods = generate_lods(meshes[0], get_lod_ratios(scene))
+
     # Exports all meshes to the PRM file
     with open(filepath, "wb") as file:
         for me in meshes:
@@ -64,14 +91,274 @@ def export_file(filepath, scene):
             # Writes the PRM object to a file
             if prm:
                 prm.write(file)
+
+        # LoDs are written after the base mesh like hand-made ones
+        for corners in lods:
+            records = get_mesh_records(meshes[0], obj, scene, corners=corners)
+            prm = build_mesh(records, np.arange(len(corners[0])), scene=scene)
+            if prm:
+                prm.write(file)
+
+def get_lod_ratios(scene):
+    """ Gets the LoD target ratios (0-1) from the scene, highest first """
+    ratios = []
+    for value in scene.prm_lod_ratios.replace(";", ",").split(","):
+        try:
+            ratio = float(value)
+        except ValueError:
+            print("Invalid LoD ratio: {}".format(value))
+            continue
+        if 0 < ratio < 1:
+            ratios.append(ratio)
+    return sorted(ratios, reverse=True)
+
+def get_lod_boundaries(me, loop_verts):
+    """
+    Gets two vertex masks for the LoD generation: seams (vertices whose
+    loops differ in UV or colors) and locked vertices (seams, mesh borders
+    and vertices between faces of a different type, texture number or
+    material).
+    """
+    num_verts = len(me.vertices)
+    num_faces = len(me.polygons)
+    loop_starts = np.empty(num_faces, dtype=np.int64)
+    loop_totals = np.empty(num_faces, dtype=np.int64)
+    material_indices = np.empty(num_faces, dtype=np.int64)
+    me.polygons.foreach_get("loop_start", loop_starts)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    me.polygons.foreach_get("material_index", material_indices)
+
+    # First loop of each vertex to compare the other loops to
+    order = np.argsort(loop_verts, kind="stable")
+    used_verts, first = np.unique(loop_verts[order], return_index=True)
+    first_loops = np.zeros(num_verts, dtype=np.int64)
+    first_loops[used_verts] = order[first]
+
+    def differs(values):
+        values = values.reshape(len(loop_verts), -1)
+        mask = np.zeros(num_verts, dtype=bool)
+        changed = np.any(values != values[first_loops[loop_verts]], axis=1)
+        mask[loop_verts[changed]] = True
+        return mask
+
+    # Loop data (UV and colors)
+    loop_values = []
+    uv_layer = me.uv_layers.get("UVMap")
+    if uv_layer:
+        uvs = np.empty(len(loop_verts) * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uvs)
+        loop_values.append(uvs.reshape(-1, 2))
+    for name in ("Col", "Alpha", "Env"):
+        colors = get_loop_colors(me, name, loop_verts)
+        if colors is not None:
+            loop_values.append(colors)
+    seams = np.zeros(num_verts, dtype=bool)
+    if loop_values:
+        seams = differs(np.column_stack(loop_values))
+
+    # Face data of each loop
+    loop_polys = np.empty(len(loop_verts), dtype=np.int64)
+    offsets = np.arange(loop_totals.sum()) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_polys[np.repeat(loop_starts, loop_totals) + offsets] = np.repeat(np.arange(num_faces), loop_totals)
+    face_keys = np.column_stack((
+        get_face_values(me, "Type", np.int64, 0),
+        get_face_values(me, "Texture Number", np.int64, 0),
+        material_indices,
+    ))
+    locked = seams | differs(face_keys[loop_polys])
+
+    # Borders and non-manifold edges
+    loop_edges = np.empty(len(loop_verts), dtype=np.int64)
+    edge_verts = np.empty(len(me.edges) * 2, dtype=np.int64)
+    me.loops.foreach_get("edge_index", loop_edges)
+    me.edges.foreach_get("vertices", edge_verts)
+    edge_faces = np.bincount(loop_edges, minlength=len(me.edges))
+    locked[edge_verts.reshape(-1, 2)[edge_faces != 2].ravel()] = True
+
+    return seams, locked
+
+def generate_lods(me, ratios):
+    """
+    Generates reduced LoDs of a mesh with a quadric error decimator.
+    Edges are collapsed into one of their vertices, which keeps its
+    position and loop data. Vertices on seams, borders and face type,
+    texture or material boundaries are never moved.
+    Returns the corners (see get_mesh_records) of each LoD.
+    """
+    num_verts = len(me.vertices)
+    loop_verts = np.empty(len(me.loops), dtype=np.int64)
+    coords = np.empty(num_verts * 3, dtype=np.float64)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    me.vertices.foreach_get("co", coords)
+    coords = coords.reshape(-1, 3)
+
+    me.calc_loop_triangles()
+    num_tris = len(me.loop_triangles)
+    tri_loops = np.empty(num_tris * 3, dtype=np.int64)
+    tri_polys = np.empty(num_tris, dtype=np.int64)
+    me.loop_triangles.foreach_get("loops", tri_loops)
+    me.loop_triangles.foreach_get("polygon_index", tri_polys)
+    tri_loops = tri_loops.reshape(-1, 3)
+    tri_verts = loop_verts[tri_loops]
+
+    seams, locked = get_lod_boundaries(me, loop_verts)
+    targets = [max(1, int(num_tris * ratio)) for ratio in ratios]
+    snapshots = decimate_triangles(coords, tri_verts, seams, locked, targets)
+
+    # Any loop of a vertex that isn't on a seam has its loop data
+    rep_loops = np.zeros(num_verts, dtype=np.int64)
+    rep_loops[loop_verts] = np.arange(len(loop_verts))
+
+    lods = []
+    counts = [str(num_tris)]
+    for alive, verts in snapshots:
+        loops = np.where(verts == tri_verts[alive], tri_loops[alive], rep_loops[verts])
+        lods.append((tri_polys[alive], loops[:, TRI_ORDER]))
+        counts.append(str(len(alive)))
+    print("LoD triangle counts: {}".format(", ".join(counts)))
+    return lods
+
+def decimate_triangles(coords, tri_verts, seams, locked, targets):
+    """
+    Collapses edges in order of their quadric error until the amount of
+    triangles reaches each of the (descending) targets. A vertex u can be
+    collapsed into v if u isn't locked and v isn't on a seam.
+    Returns (remaining triangle indices, their vertices) for each target.
+    """
+    num_tris = len(tri_verts)
+
+    # Plane quadrics of the triangles, accumulated per vertex
+    p0, p1, p2 = (coords[tri_verts[:, i]] for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    areas = np.linalg.norm(normals, axis=1)
+    normals = normals / np.maximum(areas, 1e-12)[:, None]
+    planes = np.column_stack((normals, -(normals * p0).sum(axis=1)))
+    tri_quadrics = planes[:, :, None] * planes[:, None, :] * areas[:, None, None]
+    quadrics = np.zeros((len(coords), 4, 4))
+    for i in range(3):
+        np.add.at(quadrics, tri_verts[:, i], tri_quadrics)
+
+    homogeneous = np.column_stack((coords, np.ones(len(coords))))
+    tris = tri_verts.tolist()
+    alive = [True] * num_tris
+    vert_tris = [set() for _ in range(len(coords))]
+    for t, verts in enumerate(tris):
+        for v in verts:
+            vert_tris[v].add(t)
+    version = [0] * len(coords)
+
+    heap = []
+    counter = itertools.count()
+
+    def push(u, v):
+        if locked[u] or seams[v]:
+            return
+        p = homogeneous[v]
+        cost = float(p @ (quadrics[u] + quadrics[v]) @ p)
+        heapq.heappush(heap, (cost, next(counter), u, v, version[u], version[v]))
+
+    def neighbors(v):
+        return {w for t in vert_tris[v] for w in tris[t]} - {v}
+
+    for a, b in {tuple(sorted(e)) for verts in tris for e in zip(verts, verts[1:] + verts[:1])}:
+        push(a, b)
+        push(b, a)
+
+    def can_collapse(u, v):
+        shared = vert_tris[u] & vert_tris[v]
+        # Keeps the surface manifold
+        if len(neighbors(u) & neighbors(v)) != len(shared):
+            return False
+        # Rejects degenerate triangles and those turning away from their
+        # current or original orientation
+        for t in vert_tris[u] - shared:
+            a, b, c = (coords[w] for w in tris[t])
+            before = np.cross(b - a, c - a)
+            a, b, c = (coords[v if w == u else w] for w in tris[t])
+            after = np.cross(b - a, c - a)
+            length = np.linalg.norm(after)
+            if length < 1e-12:
+                return False
+            after /= length
+            if before @ after < 0.5 * np.linalg.norm(before) or normals[t] @ after < 0.5:
+                return False
+        return True
+
+    snapshots = []
+    num_alive = num_tris
+    targets = list(targets)
+
+    while targets and heap:
+        if num_alive <= targets[0]:
+            snapshots.append(get_decimated(alive, tris))
+            targets.pop(0)
+            continue
+
+        cost, _, u, v, version_u, version_v = heapq.heappop(heap)
+        if version_u != version[u] or version_v != version[v]:
+            continue
+        if not vert_tris[u] or not can_collapse(u, v):
+            continue
+
+        # Collapses u into v
+        for t in vert_tris[u] & vert_tris[v]:
+            alive[t] = False
+            num_alive -= 1
+            for w in tris[t]:
+                if w != u:
+                    vert_tris[w].discard(t)
+        for t in vert_tris[u]:
+            if alive[t]:
+                tris[t] = [v if w == u else w for w in tris[t]]
+                vert_tris[v].add(t)
+        vert_tris[u] = set()
+        quadrics[v] += quadrics[u]
+        version[u] += 1
+        version[v] += 1
+
+        for w in neighbors(v):
+            push(v, w)
+            push(w, v)
+
+    # Targets that couldn't be reached get the most decimated mesh
+    for target in targets:
+        snapshots.append(get_decimated(alive, tris))
+    return snapshots
+
+def get_decimated(alive, tris):
+    """ Gets the remaining triangle indices and their vertices """
+    remaining = np.flatnonzero(alive)
+    verts = np.array([tris[t] for t in remaining], dtype=np.int64).reshape(-1, 3)
+    return remaining, verts
                 
-def get_texture_from_material(face, obj):
+def get_texture_from_material(face, obj, cache=None):
+    """
+    Gets the image of the material assigned to a face. Results are stored
+    per material slot in the cache dict, so each slot is only resolved once
+    per export.
+    """
+    return get_slot_texture(obj, face.material_index, cache)[0]
+
+def get_slot_texture(obj, material_index, cache=None):
+    """ Returns (image, texture number) for a material slot index """
+    if cache is not None and material_index in cache:
+        return cache[material_index]
+
+    image = find_slot_image(obj, material_index)
+    texture = texture_to_int(image.name) if image else -1
+
+    if cache is not None:
+        cache[material_index] = (image, texture)
+    return image, texture
+
+def find_slot_image(obj, material_index):
+    """ Looks up the first image texture node of a material slot """
     # Check if the object has materials
     if obj.material_slots:
         # Ensure the material index is within the valid range
-        if face.material_index < len(obj.material_slots):
+        if material_index < len(obj.material_slots):
             # Get the material from the corresponding slot
-            mat = obj.material_slots[face.material_index].material
+            mat = obj.material_slots[material_index].material
 
             if mat and mat.node_tree:
                 # Iterate over all nodes in the material
@@ -85,18 +372,6 @@ def get_texture_from_material(face, obj):
                         else:
                             print(f"No image found for material: {mat.name} on {obj.name}")
 
-            # Ensure material is added to object data if not already present
-            if mat.name not in obj.data.materials:
-                obj.data.materials.append(mat)
-
-            # Assign the material index to the face
-            face.material_index = obj.data.materials.find(mat.name)
-
-            # Explicitly assign the material to the object mesh data
-            for f in obj.data.polygons:
-                if f.select:
-                    f.material_index = face.material_index
-
     # Fallback to car.bmp material logic for car parts
     car_part_prefixes = ["body", "wheel", "axle", "spring", "pin"]
     if any(obj.name.startswith(prefix) for prefix in car_part_prefixes):
@@ -118,6 +393,458 @@ def export_mesh(me, obj, scene, filepath, world=None):
     boundaries and the per-face environment color.
     If an rvstruct world object is provided, this will return an rvstruct.mesh
     instead of an rvstruct.PRM.
+    Meshes with n-gons go through bmesh for triangulation, all others are
+    exported from arrays.
+    """
+    loop_totals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    if np.any(loop_totals > 4):
+        return export_mesh_bmesh(me, obj, scene, filepath, world)
+    return export_mesh_arrays(me, obj, scene, world)
+
+def get_export_matrix(obj, scene, world=None):
+    """
+    Gets the matrix the bmesh export applies to the vertices: scale and
+    rotation for PRMs, the whole (unparented) transformation for .w meshes.
+    """
+    def in_space(mat, space):
+        return space.inverted() @ mat @ space
+
+    def rotation_about(center, rotation):
+        center = Vector(center)
+        return Matrix.Translation(center) @ rotation.to_4x4() @ Matrix.Translation(-center)
+
+    mat = Matrix.Identity(4)
+
+    if world is None:
+        if scene.apply_scale:
+            mat = Matrix.Diagonal((*obj.scale, 1.0)) @ mat
+        if scene.apply_rotation:
+            rotation = rotation_about(obj.location, obj.rotation_euler.to_matrix())
+            mat = in_space(rotation, obj.matrix_basis) @ mat
+        return mat
+
+    # Without a parent the world matrix is the basis of the object
+    if obj.parent:
+        spc = obj.matrix_world.copy()
+        location, rotation, scale = spc.decompose()
+        rotation = rotation.to_matrix()
+    else:
+        spc = obj.matrix_basis.copy()
+        location, rotation, scale = obj.location, obj.rotation_euler.to_matrix(), obj.scale
+
+    mat = in_space(Matrix.Diagonal((*scale, 1.0)), spc) @ mat
+    mat = in_space(Matrix.Translation(location), spc) @ mat
+    mat = in_space(rotation_about(location, rotation), spc) @ mat
+    return mat
+
+def get_loop_colors(me, name, loop_verts):
+    """ Gets a color attribute as (loops, 4) floats or None if missing """
+    attr = me.color_attributes.get(name)
+    if attr is None or attr.domain not in {'CORNER', 'POINT'}:
+        return None
+
+    values = np.empty(len(attr.data) * 4, dtype=np.float32)
+    # Byte colors are read unconverted like the bmesh color layers
+    prop = "color_srgb" if attr.data_type == 'BYTE_COLOR' else "color"
+    attr.data.foreach_get(prop, values)
+    values = values.reshape(-1, 4)
+
+    if attr.domain == 'POINT':
+        values = values[loop_verts]
+    return values
+
+def get_face_values(me, name, dtype, default):
+    """ Gets a face attribute as an array, filled with default if missing """
+    values = np.full(len(me.polygons), default, dtype=dtype)
+    attr = me.attributes.get(name)
+    if attr is not None and attr.domain == 'FACE' and len(attr.data) == len(values):
+        attr.data.foreach_get("value", values)
+    return values
+
+def export_mesh_arrays(me, obj, scene, world=None):
+    """
+    Exports a mesh of tris and quads without going through bmesh. All
+    layers are read with foreach_get and the polygon and vertex records are
+    built with NumPy.
+    """
+    records = get_mesh_records(me, obj, scene, world)
+    return build_mesh(records, world=world, scene=scene)
+
+def get_mesh_records(me, obj, scene, world=None, corners=None):
+    """
+    Reads a mesh and builds the RV polygon and vertex records of all its
+    faces. N-gons are split into their loop triangles. The vertex indices
+    refer to the whole mesh and are stored separately (-1 for unused
+    slots) so that build_mesh can export any subset of the faces.
+    Other faces made of the mesh's loops (e.g. a generated LoD) can be
+    given as corners: (polygon indices, loop indices in RV order).
+    """
+    num_faces = len(me.polygons)
+    num_verts = len(me.vertices)
+    num_loops = len(me.loops)
+
+    # Reads the mesh data
+    loop_starts = np.empty(num_faces, dtype=np.int64)
+    loop_totals = np.empty(num_faces, dtype=np.int64)
+    material_indices = np.empty(num_faces, dtype=np.int64)
+    loop_verts = np.empty(num_loops, dtype=np.int64)
+    coords = np.empty(num_verts * 3, dtype=np.float32)
+    normals = np.empty(num_verts * 3, dtype=np.float32)
+    me.polygons.foreach_get("loop_start", loop_starts)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    me.polygons.foreach_get("material_index", material_indices)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    me.vertices.foreach_get("co", coords)
+    me.vertex_normals.foreach_get("vector", normals)
+
+    # Source polygon and loop indices in RV order of every exported face
+    if corners is not None:
+        face_polys, loops = corners
+        is_quad = loops[:, 3] != loops[:, 2]
+    else:
+        face_polys = np.flatnonzero(loop_totals <= 4)
+        is_quad = loop_totals[face_polys] == 4
+        loops = loop_starts[face_polys, None] + np.where(is_quad[:, None], QUAD_ORDER, TRI_ORDER)
+
+    if corners is None and len(face_polys) < num_faces:
+        me.calc_loop_triangles()
+        num_tris = len(me.loop_triangles)
+        tri_loops = np.empty(num_tris * 3, dtype=np.int64)
+        tri_polys = np.empty(num_tris, dtype=np.int64)
+        me.loop_triangles.foreach_get("loops", tri_loops)
+        me.loop_triangles.foreach_get("polygon_index", tri_polys)
+        ngon_tris = loop_totals[tri_polys] > 4
+        print("Triangulated {} n-gons".format(num_faces - len(face_polys)))
+
+        # The triangles of a polygon are contiguous, a stable sort keeps them
+        face_polys = np.concatenate((face_polys, tri_polys[ngon_tris]))
+        loops = np.concatenate((loops, tri_loops.reshape(-1, 3)[ngon_tris][:, TRI_ORDER]))
+        order = np.argsort(face_polys, kind="stable")
+        face_polys = face_polys[order]
+        loops = loops[order]
+        is_quad = loop_totals[face_polys] == 4
+
+    used = is_quad[:, None] | (np.arange(4) < 3)
+
+    face_types = get_face_values(me, "Type", np.int64, 0)[face_polys]
+    vc = get_loop_colors(me, "Col", loop_verts)
+    va = get_loop_colors(me, "Alpha", loop_verts)
+
+    polys = np.zeros(len(face_polys), dtype=POLYGON_DTYPE)
+    polys["type"] = (face_types & FACE_PROP_MASK) | np.where(is_quad, FACE_QUAD, 0)
+
+    # Texture numbers are resolved once per material slot
+    texture_cache = {}
+    slots = material_indices[face_polys]
+    textures = np.full(len(face_polys), -1, dtype=np.int64)
+    for slot in np.unique(slots):
+        textures[slots == slot] = get_slot_texture(obj, int(slot), texture_cache)[1]
+    polys["texture"] = textures
+
+    # Vertex colors and alpha, unused slots are white and opaque
+    colors = np.zeros((len(face_polys), 4, 4), dtype=np.int64)
+    if vc is not None:
+        rgb = (vc[loops, :3].astype(np.float64) * 255).astype(np.int64)
+        colors[..., 0] = rgb[..., 2]
+        colors[..., 1] = rgb[..., 1]
+        colors[..., 2] = rgb[..., 0]
+    else:
+        colors[..., :3] = 255
+    if va is not None:
+        alpha = va[loops, :3].astype(np.float64)
+        colors[..., 3] = ((alpha[..., 0] + alpha[..., 1] + alpha[..., 2]) * 255 / 3).astype(np.int64)
+    else:
+        colors[..., 3] = 255
+    colors[~used] = (255, 255, 255, 0)
+    polys["colors"] = np.clip(colors, 0, 255)
+
+    uv_layer = me.uv_layers.get("UVMap")
+    if uv_layer:
+        uvs = np.empty(num_loops * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)[loops].astype(np.float64)
+        uvs[..., 1] = 1 - uvs[..., 1]
+        uvs[~used] = 0
+        polys["uv"] = uvs
+
+    # Environment colors (r, g, b, alpha) of .w meshes
+    env_colors = None
+    if world is not None:
+        env = get_loop_colors(me, "Env", loop_verts)
+        if env is None:
+            env = np.ones((num_loops, 4), dtype=np.float32)
+        # Sums up the loops in their original order, the unused slot adds 0
+        corners = np.where(used[..., None], env[loops, :3].astype(np.float64), 0.0)
+        env_sums = corners[:, 3] + corners[:, 2] + corners[:, 1] + corners[:, 0]
+        env_colors = np.zeros((len(face_polys), 4), dtype=np.int64)
+        env_colors[:, :3] = (env_sums / np.where(is_quad, 4, 3)[:, None] * 255).astype(np.int64)
+        env_alpha = get_face_values(me, "EnvAlpha", np.float32, 0.0)[face_polys]
+        env_colors[:, 3] = (env_alpha.astype(np.float64) * 255).astype(np.int64)
+
+    # Vertex positions and normals in RV coordinates
+    mat = np.array(get_export_matrix(obj, scene, world), dtype=np.float64)
+    coords = coords.reshape(-1, 3).astype(np.float64) @ mat[:3, :3].T + mat[:3, 3]
+    positions = np.column_stack((coords[:, 0], -coords[:, 2], coords[:, 1])) / SCALE
+    normals = normals.reshape(-1, 3)
+
+    verts = np.zeros(num_verts, dtype=VERTEX_DTYPE)
+    verts["position"] = positions
+    verts["normal"] = np.column_stack((normals[:, 0], -normals[:, 2], normals[:, 1]))
+
+    return {
+        "polygons": polys,
+        "vertex_ids": np.where(used, loop_verts[loops], -1),
+        "env_colors": env_colors,
+        "vertices": verts,
+        "positions": positions,
+    }
+
+def build_mesh(records, faces=None, world=None, scene=None):
+    """
+    Builds a PRM (or a .w Mesh if a world is given) from mesh records.
+    If face indices are given, only those faces and the vertices they use
+    are exported. The scene's export options (e.g. polygon sorting) are
+    applied if a scene is given.
+    """
+    polys = records["polygons"]
+    vertex_ids = records["vertex_ids"]
+    env_colors = records["env_colors"]
+    verts = records["vertices"]
+    positions = records["positions"]
+
+    if faces is not None:
+        polys = polys[faces]
+        vertex_ids = vertex_ids[faces]
+        if env_colors is not None:
+            env_colors = env_colors[faces]
+
+        # Only keeps the vertices used by the faces
+        used_verts = np.unique(vertex_ids[vertex_ids >= 0])
+        vertex_ids = np.where(vertex_ids >= 0, np.searchsorted(used_verts, vertex_ids), -1)
+        verts = verts[used_verts]
+        positions = positions[used_verts]
+    else:
+        polys = polys.copy()
+
+    if scene is not None and getattr(scene, "sort_polygons", False):
+        order = sort_polygons(polys["type"], polys["texture"])
+        polys = polys[order]
+        vertex_ids = vertex_ids[order]
+        if env_colors is not None:
+            env_colors = env_colors[order]
+
+    if len(polys) > 65535:
+        queue_error(
+            "exporting mesh",
+            "Too many polygons, try splitting up your mesh."
+        )
+        return None
+
+    if len(verts) > 65535:
+        queue_error(
+            "exporting mesh",
+            "Too many vertices, try splitting up your mesh."
+        )
+        return None
+
+    if scene is not None and getattr(scene, "optimize_vertex_cache", False):
+        acmr_before = get_acmr(vertex_ids)
+        order = optimize_vertex_cache(vertex_ids, get_render_states(polys["type"], polys["texture"]))
+        polys = polys[order]
+        vertex_ids = vertex_ids[order]
+        if env_colors is not None:
+            env_colors = env_colors[order]
+
+        # Renumbers the vertices in the order they are first used
+        vert_order = get_first_use_order(vertex_ids, len(verts))
+        remap = np.empty(len(verts), dtype=np.int64)
+        remap[vert_order] = np.arange(len(verts))
+        vertex_ids = np.where(vertex_ids >= 0, remap[np.maximum(vertex_ids, 0)], -1)
+        verts = verts[vert_order]
+        positions = positions[vert_order]
+        print("ACMR: {:.3f} -> {:.3f}".format(acmr_before, get_acmr(vertex_ids)))
+
+    # Fills up unused indices with 0s
+    polys["vertex_indices"] = np.maximum(vertex_ids, 0)
+
+    # Creates an empty PRM or Mesh structure
+    if world is None:
+        prm = rvstruct.PRM()
+    else:
+        prm = rvstruct.Mesh()
+
+    prm.polygon_count = len(polys)
+    prm.vertex_count = len(verts)
+    prm.polygons = rvstruct.PolygonArray(polys)
+    prm.vertices = rvstruct.VertexArray(verts)
+
+    # World extras
+    if world is not None:
+        for f in np.flatnonzero(polys["type"] & FACE_ENV):
+            r, g, b, alpha = (int(c) for c in env_colors[f])
+            world.env_list.append(rvstruct.Color(color=[r, g, b], alpha=alpha))
+
+        lo = positions.min(axis=0)
+        hi = positions.max(axis=0)
+        rvbbox = (lo[0], hi[0], lo[1], hi[1], lo[2], hi[2])
+        rvbbox = tuple(float(c) for c in rvbbox)
+        center, radius = get_bound_ball(positions, rvbbox)
+        prm.bound_ball_center = rvstruct.Vector(data=center)
+        prm.bound_ball_radius = radius
+        prm.bbox = rvstruct.BoundingBox(data=rvbbox)
+
+    return prm
+
+def get_render_states(types, textures):
+    """ Gets the render state (texture and state flags) of each polygon """
+    types = np.asarray(types, dtype=np.int64) & FACE_STATE_MASK
+    return (np.asarray(textures, dtype=np.int64) << 16) | types
+
+def count_state_changes(states):
+    """ Counts the render state changes when drawing polygons in order """
+    return int(np.count_nonzero(states[1:] != states[:-1]))
+
+def sort_polygons(types, textures):
+    """
+    Gets the order that groups polygons by texture and state flags,
+    keeping the original order within each group. Reports the render state
+    changes before and after.
+    """
+    states = get_render_states(types, textures)
+    order = np.argsort(states, kind="stable")
+    print("Render state changes: {} -> {}".format(
+        count_state_changes(states), count_state_changes(states[order])))
+    return order
+
+def get_acmr(vertex_ids, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Gets the average cache miss ratio (vertex transforms per triangle) of
+    drawing the polygons in order with a FIFO vertex cache. Quads are
+    drawn as two triangles.
+    """
+    cache = collections.deque(maxlen=cache_size)
+    misses = 0
+    num_tris = 0
+    for ids in vertex_ids.tolist():
+        a, b, c, d = ids
+        tris = ((a, b, c), (a, c, d)) if d >= 0 else ((a, b, c),)
+        for tri in tris:
+            num_tris += 1
+            for v in tri:
+                if v not in cache:
+                    misses += 1
+                    cache.append(v)
+    return misses / num_tris if num_tris else 0.0
+
+def get_vertex_score(cache_pos, valence, cache_size=VERTEX_CACHE_SIZE):
+    """ Vertex score of Forsyth's linear-speed vertex cache optimization """
+    if valence == 0:
+        return -1.0
+    score = 0.0
+    if cache_pos >= 0:
+        if cache_pos < 3:
+            # Vertices of the last polygon are reused by its neighbors anyway
+            score = 0.75
+        else:
+            score = (1.0 - (cache_pos - 3) / (cache_size - 3)) ** 1.5
+    # Boosts vertices with few polygons left so they get finished
+    return score + 2.0 * valence ** -0.5
+
+def optimize_vertex_cache(vertex_ids, states, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Reorders polygons for the post-transform vertex cache (Tom Forsyth's
+    algorithm with an LRU cache model). Only polygons of the same render
+    state are reordered among each other, so groups stay intact.
+    Returns the new polygon order.
+    """
+    order = []
+    group_starts = np.flatnonzero(np.diff(states)) + 1
+    bounds = [0] + group_starts.tolist() + [len(vertex_ids)]
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        polys = [[v for v in ids if v >= 0] for ids in vertex_ids[start:end].tolist()]
+
+        # Polygons using each vertex and the vertex scores
+        vert_polys = {}
+        for p, verts in enumerate(polys):
+            for v in verts:
+                vert_polys.setdefault(v, []).append(p)
+        valence = {v: len(p) for v, p in vert_polys.items()}
+        vert_score = {v: get_vertex_score(-1, n, cache_size) for v, n in valence.items()}
+        poly_score = [sum(vert_score[v] for v in verts) for verts in polys]
+
+        emitted = [False] * len(polys)
+        cache = []
+        next_poly = 0
+        best = max(range(len(polys)), key=poly_score.__getitem__) if polys else -1
+
+        for _ in range(len(polys)):
+            if best < 0:
+                # No candidates in the cache, continues with the next polygon
+                while emitted[next_poly]:
+                    next_poly += 1
+                best = next_poly
+
+            emitted[best] = True
+            order.append(start + best)
+
+            # Updates valences and moves the vertices to the cache front
+            for v in polys[best]:
+                valence[v] -= 1
+                vert_polys[v].remove(best)
+                if v in cache:
+                    cache.remove(v)
+            cache = polys[best] + cache
+            evicted = cache[cache_size:]
+            del cache[cache_size:]
+
+            # Rescores the affected vertices and their polygons
+            candidates = set()
+            for pos, v in enumerate(cache):
+                vert_score[v] = get_vertex_score(pos, valence[v], cache_size)
+                candidates.update(vert_polys[v])
+            for v in evicted:
+                vert_score[v] = get_vertex_score(-1, valence[v], cache_size)
+                candidates.update(vert_polys[v])
+
+            best = -1
+            best_score = -1.0
+            for p in candidates:
+                score = sum(vert_score[v] for v in polys[p])
+                poly_score[p] = score
+                if score > best_score:
+                    best, best_score = p, score
+
+    return np.array(order, dtype=np.int64)
+
+def get_first_use_order(vertex_ids, num_verts):
+    """
+    Gets the vertex order in which the polygons first use them. Unused
+    vertices are appended in their original order.
+    """
+    ids = vertex_ids[vertex_ids >= 0]
+    unique, first = np.unique(ids, return_index=True)
+    used = unique[np.argsort(first)]
+    unused = np.setdiff1d(np.arange(num_verts), used, assume_unique=True)
+    return np.concatenate((used, unused))
+
+def get_bound_ball(positions, rvbbox):
+    """
+    Gets the bound ball (center, radius) of a .w mesh and reports how
+    much smaller it is than the ball around the bbox center.
+    """
+    center, radius = bounding_sphere(positions)
+    bbox_center = np.array(center_from_rvbbox(rvbbox))
+    bbox_radius = float(np.sqrt(((np.asarray(positions) - bbox_center) ** 2).sum(axis=1)).max())
+    if bbox_radius > 0:
+        print("Bound ball radius {:.2f} -> {:.2f} ({:.1f}% smaller)".format(
+            bbox_radius, radius, (1 - radius / bbox_radius) * 100))
+    return center, radius
+
+def export_mesh_bmesh(me, obj, scene, filepath, world=None):
+    """
+    Exports a mesh through bmesh. Used for meshes that contain n-gons.
     """
     # Creates a bmesh from the supplied mesh
     bm = bmesh.new()
@@ -217,6 +944,11 @@ def export_mesh(me, obj, scene, filepath, world=None):
         )
         return None
 
+    # Material slot index -> (image, texture number), resolved once per slot
+    texture_cache = {}
+    # Polygon index -> environment color
+    env_colors = {}
+
     for face in bm.faces:
         poly = rvstruct.Polygon()
         is_quad = len(face.verts) == 4
@@ -232,11 +964,7 @@ def export_mesh(me, obj, scene, filepath, world=None):
         if scene.use_tex_num and texnum_layer:
             poly.texture = face[texnum_layer]
         # Falls back to texture if not enabled or texnum layer not found
-        image = get_texture_from_material(face, obj)
-        if image:
-            poly.texture = texture_to_int(image.name)
-        else:
-            poly.texture = -1
+        image, poly.texture = get_slot_texture(obj, face.material_index, texture_cache)
 
         # Sets vertex indices for the polygon
         vert_order = [2, 1, 0, 3] if not is_quad else [3, 2, 1, 0]
@@ -277,10 +1005,23 @@ def export_mesh(me, obj, scene, filepath, world=None):
                 rgb = [int(c * 255) for c in get_average_vcol2([face], env_layer)]
                 alpha = int(face[env_alpha_layer] * 255)
                 col = rvstruct.Color(color=rgb, alpha=alpha)
-                world.env_list.append(col)
+                env_colors[len(prm.polygons)] = col
 
         prm.polygons.append(poly)
 
+    if getattr(scene, "sort_polygons", False):
+        order = sort_polygons(
+            [poly.type for poly in prm.polygons],
+            [poly.texture for poly in prm.polygons]
+        )
+        prm.polygons = [prm.polygons[i] for i in order]
+    else:
+        order = range(len(prm.polygons))
+
+    # Environment colors are stored in the order of the polygons
+    if world is not None:
+        world.env_list.extend(env_colors[i] for i in order if i in env_colors)
+
     # export vertex positions and normals
     for vertex in bm.verts:
         coord = to_revolt_coord(vertex.co)
@@ -293,39 +1034,11 @@ def export_mesh(me, obj, scene, filepath, world=None):
     # World extras
     if world is not None:
         rvbbox = rvbbox_from_bm(bm)
-        center = center_from_rvbbox(rvbbox)
-        radius = radius_from_bmesh(bm, center)
+        positions = [to_revolt_coord(v.co) for v in bm.verts]
+        center, radius = get_bound_ball(positions, rvbbox)
         prm.bound_ball_center = rvstruct.Vector(data=center)
         prm.bound_ball_radius = radius
         prm.bbox = rvstruct.BoundingBox(data=rvbbox)
 
     bm.free()
     return prm
-
-def set_material_to_col(mesh_objects):
-    """Sets the material to Vertex Colour (_Col) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'COL'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-def set_material_to_texture(mesh_objects):
-    """Sets the material to Texture (UV_TEX) for all mesh objects."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    for obj in mesh_objects:
-        obj.data.material_choice = 'UV_TEX'
-        bpy.context.view_layer.objects.active = obj
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.object.assign_materials_auto()
-        bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
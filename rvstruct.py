@@ -28,8 +28,10 @@ Missing Formats:
 - .lit (Lights)
 """
 
+import io
 import os
 import struct
+import numpy as np
 from math import ceil, sqrt
 
 
@@ -111,31 +113,67 @@ class World:
         for col in self.env_list:
             col.write(file)
 
-    def generate_bigcubes(self):
-        bb = BoundingBox()
-        for mesh in self.meshes:
-            for v in mesh.vertices:
-                bb.xlo = v.position.x if v.position.x < bb.xlo else bb.xlo
-                bb.xhi = v.position.x if v.position.x > bb.xhi else bb.xhi
-                bb.ylo = v.position.y if v.position.y < bb.ylo else bb.ylo
-                bb.yhi = v.position.y if v.position.y > bb.yhi else bb.yhi
-                bb.zlo = v.position.z if v.position.z < bb.zlo else bb.zlo
-                bb.zhi = v.position.z if v.position.z > bb.zhi else bb.zhi
-
-        bcube = BigCube()
-        bcube.center = Vector(data=(
-            (bb.xlo + bb.xhi) / 2,
-            (bb.ylo + bb.yhi) / 2,
-            (bb.zlo + bb.zhi) / 2)
+    def generate_bigcubes(self, groups=None):
+        """
+        Generates one BigCube per group of mesh indices (see cluster_meshes).
+        Without groups, a single BigCube contains all meshes.
+        """
+        if not groups:
+            groups = [range(len(self.meshes))]
+        self.bigcubes = [self.get_bigcube(group) for group in groups if len(group)]
+        self.bigcube_count = len(self.bigcubes)
+
+    def get_bigcube(self, mesh_indices):
+        """
+        Gets a BigCube around the vertices of the given meshes. The size is
+        the distance from the center to the furthest vertex.
+        """
+        positions = np.concatenate(
+            [get_positions(self.meshes[i].vertices) for i in mesh_indices]
         )
-        max_vert = Vector(data=(bb.xhi, bb.yhi, bb.zhi))
-        bcube.size = bcube.center.get_distance_to(max_vert)
+        lo = positions.min(axis=0)
+        hi = positions.max(axis=0)
+        center = (lo + hi) / 2
 
-        bcube.mesh_count = len(self.meshes)
-        bcube.mesh_indices = [n for n in range(0, bcube.mesh_count)]
-
-        self.bigcube_count = 1
-        self.bigcubes = [bcube]
+        bcube = BigCube()
+        bcube.center = Vector(data=tuple(float(c) for c in center))
+        bcube.size = float(np.sqrt(((positions - center) ** 2).sum(axis=1)).max())
+        bcube.mesh_count = len(mesh_indices)
+        bcube.mesh_indices = list(mesh_indices)
+        return bcube
+
+    def cluster_meshes(self, count, max_meshes=None):
+        """
+        Groups the meshes into count clusters by their bound ball centers.
+        The meshes are recursively split along the longest axis, each side
+        getting meshes in proportion to its number of clusters. More
+        clusters are made if one would have more than max_meshes meshes.
+        Returns a list of mesh index lists.
+        """
+        centers = np.array(
+            [mesh.bound_ball_center.data for mesh in self.meshes],
+            dtype=np.float64
+        ).reshape(-1, 3)
+        if max_meshes:
+            count = max(count, -(-len(centers) // max_meshes))
+        count = max(1, min(count, len(centers)))
+
+        groups = []
+
+        def split(indices, num_groups):
+            if num_groups <= 1:
+                groups.append(sorted(indices.tolist()))
+                return
+            points = centers[indices]
+            axis = np.argmax(points.max(axis=0) - points.min(axis=0))
+            num_left = num_groups // 2
+            cut = len(indices) * num_left // num_groups
+            order = np.argpartition(points[:, axis], cut)
+            split(indices[order[:cut]], num_left)
+            split(indices[order[cut:]], num_groups - num_left)
+
+        split(np.arange(len(centers)), count)
+        return groups
 
     def __repr__(self):
         return "World"
@@ -260,10 +298,8 @@ class PRM:
         file.write(struct.pack("<H", self.polygon_count))
         file.write(struct.pack("<H", self.vertex_count))
 
-        for polygon in self.polygons:
-            polygon.write(file)
-        for vertex in self.vertices:
-            vertex.write(file)
+        write_sequence(file, self.polygons)
+        write_sequence(file, self.vertices)
 
     def as_dict(self):
         dic = { "polygon_count": self.polygon_count,
@@ -333,10 +369,8 @@ class Mesh:
         file.write(struct.pack("<H", self.vertex_count))
 
         # Also give the polygon a reference to w so it can write the env bit
-        for polygon in self.polygons:
-            polygon.write(file)
-        for vertex in self.vertices:
-            vertex.write(file)
+        write_sequence(file, self.polygons)
+        write_sequence(file, self.vertices)
 
     def as_dict(self):
         dic = { "bound_ball_center": self.bound_ball_center,
@@ -648,6 +682,73 @@ class Vertex:
         return dic
 
 
+class RecordArray:
+    """
+    Columnar storage for structures of a fixed binary size. The records
+    (e.g. a NumPy structured array) already have the binary layout of the
+    structure and are written in one go. Iterating yields structure objects.
+    """
+    record_type = None
+    record_size = 0
+
+    def __init__(self, records=None):
+        self.records = records      # supports len(), indexing and tobytes()
+
+    def __repr__(self):
+        return "{}Array".format(self.record_type.__name__)
+
+    def __len__(self):
+        return len(self.records) if self.records is not None else 0
+
+    def __getitem__(self, i):
+        return self.record_type(io.BytesIO(self.records[i].tobytes()))
+
+    def __iter__(self):
+        data = self.tobytes()
+        for offset in range(0, len(data), self.record_size):
+            yield self.record_type(io.BytesIO(data[offset:offset + self.record_size]))
+
+    def tobytes(self):
+        return self.records.tobytes() if self.records is not None else b""
+
+    def write(self, file):
+        file.write(self.tobytes())
+
+
+class PolygonArray(RecordArray):
+    """
+    Columnar Polygon storage (type, texture, 4 indices, 4 colors, 4 UVs)
+    """
+    record_type = Polygon
+    record_size = 60
+
+
+class VertexArray(RecordArray):
+    """
+    Columnar Vertex storage (position and normal)
+    """
+    record_type = Vertex
+    record_size = 24
+
+
+def get_positions(vertices):
+    """ Gets the positions of a sequence of vertices as an (n, 3) array """
+    if isinstance(vertices, VertexArray):
+        return vertices.records["position"].astype(np.float64)
+    return np.array(
+        [v.position.data for v in vertices], dtype=np.float64
+    ).reshape(-1, 3)
+
+
+def write_sequence(file, items):
+    """ Writes a list of structures or a RecordArray """
+    if isinstance(items, RecordArray):
+        items.write(file)
+    else:
+        for item in items:
+            item.write(file)
+
+
 class UV:
     """
     Reads UV-map structure and stores it
@@ -0,0 +1,191 @@
+"""
+Name:    shadow
+Purpose: Renders car and instance shadows without Cycles
+
+Description:
+RVGL shadows are a soft top-down silhouette on the ground. The triangles
+of an object and its children are projected onto the ground plane and
+rasterized into a height buffer. Parts far above the ground get a wider
+blur than parts close to it. Only the functions taking bpy objects use
+Blender, the rasterizer itself runs on NumPy arrays.
+
+"""
+
+import bpy
+import numpy as np
+from . import common
+
+if "common" in locals():
+    import importlib
+    importlib.reload(common)
+
+from .common import to_revolt_scale
+
+# Blur radius (sigma) per unit of height above the ground
+SHADOW_SPREAD = 0.25
+
+# Number of height bands blurred separately
+SHADOW_BANDS = 4
+
+
+def get_shadow_objects(obj):
+    """ Gets the object and its mesh children (wheels, etc.) """
+    return [ob for ob in [obj] + list(obj.children) if ob.type == 'MESH' and ob.data]
+
+
+def get_world_triangles(objects):
+    """ Gets the world space triangles of the objects as an (n, 3, 3) array """
+    triangles = []
+    for ob in objects:
+        me = ob.data
+        me.calc_loop_triangles()
+        num_verts = len(me.vertices)
+        if not num_verts or not len(me.loop_triangles):
+            continue
+
+        positions = np.empty(num_verts * 3, dtype=np.float64)
+        me.vertices.foreach_get("co", positions)
+        matrix = np.array(ob.matrix_world, dtype=np.float64)
+        positions = positions.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+        tri_verts = np.empty(len(me.loop_triangles) * 3, dtype=np.int64)
+        me.loop_triangles.foreach_get("vertices", tri_verts)
+        triangles.append(positions[tri_verts.reshape(-1, 3)])
+
+    if not triangles:
+        return np.zeros((0, 3, 3))
+    return np.concatenate(triangles)
+
+
+def get_shadow_bounds(triangles):
+    """
+    Gets the square ground area (x0, y0, size) covered by the shadow and the
+    ground height. The area includes the blur of the highest parts.
+    """
+    points = triangles.reshape(-1, 3)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    ground = lo[2]
+    margin = 3 * SHADOW_SPREAD * (hi[2] - lo[2]) + 0.02 * max(hi[0] - lo[0], hi[1] - lo[1])
+    size = max(hi[0] - lo[0], hi[1] - lo[1]) + 2 * margin
+    center = (lo[:2] + hi[:2]) / 2
+    return (center[0] - size / 2, center[1] - size / 2, size), ground
+
+
+def rasterize_heights(triangles, bounds, resolution):
+    """
+    Rasterizes the triangles from above into a (resolution, resolution)
+    buffer holding the lowest height of each covered pixel (inf elsewhere).
+    Row 0 is the back (-Y) of the area, column 0 the left (-X).
+    """
+    x0, y0, size = bounds
+    scale = resolution / size
+    heights = np.full((resolution, resolution), np.inf, dtype=np.float32)
+
+    # Pixel space coordinates, pixel centers are at .5
+    uv = (triangles[:, :, :2] - (x0, y0)) * scale
+    z = triangles[:, :, 2]
+    areas = ((uv[:, 1, 0] - uv[:, 0, 0]) * (uv[:, 2, 1] - uv[:, 0, 1]) -
+             (uv[:, 2, 0] - uv[:, 0, 0]) * (uv[:, 1, 1] - uv[:, 0, 1]))
+    lo = np.clip(np.ceil(uv.min(axis=1) - 0.5).astype(np.int64), 0, resolution)
+    hi = np.clip(np.floor(uv.max(axis=1) - 0.5).astype(np.int64) + 1, 0, resolution)
+
+    # Faces seen from the side have no area from above
+    visible = (np.abs(areas) > 1e-9) & np.all(hi > lo, axis=1)
+    for t in np.flatnonzero(visible):
+        (a, b, c), area = uv[t], areas[t]
+        xs = np.arange(lo[t, 0], hi[t, 0]) + 0.5
+        ys = np.arange(lo[t, 1], hi[t, 1]) + 0.5
+        px, py = np.meshgrid(xs, ys)
+
+        # Barycentric coordinates of the pixel centers
+        w0 = ((b[0] - px) * (c[1] - py) - (c[0] - px) * (b[1] - py)) / area
+        w1 = ((c[0] - px) * (a[1] - py) - (a[0] - px) * (c[1] - py)) / area
+        w2 = 1 - w0 - w1
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+        if not inside.any():
+            continue
+
+        tile = heights[lo[t, 1]:hi[t, 1], lo[t, 0]:hi[t, 0]]
+        depth = w0 * z[t, 0] + w1 * z[t, 1] + w2 * z[t, 2]
+        np.minimum(tile, np.where(inside, depth, np.inf), out=tile)
+
+    return heights
+
+
+def blur_heights(heights, ground, pixel_size):
+    """
+    Turns the height buffer into shadow intensities (0-1). Each height band
+    is blurred with a radius growing with its distance to the ground.
+    """
+    covered = np.isfinite(heights)
+    if not covered.any():
+        return np.zeros(heights.shape, dtype=np.float32)
+
+    distance = np.where(covered, heights - ground, 0)
+    max_distance = distance[covered].max()
+    band_size = max(max_distance, 1e-6) / SHADOW_BANDS
+    bands = np.minimum((distance / band_size).astype(np.int64), SHADOW_BANDS - 1)
+
+    shadow = np.zeros(heights.shape, dtype=np.float32)
+    for band in range(SHADOW_BANDS):
+        occupancy = (covered & (bands == band)).astype(np.float32)
+        if not occupancy.any():
+            continue
+        sigma = max(SHADOW_SPREAD * (band + 0.5) * band_size / pixel_size, 1.0)
+        np.maximum(shadow, common.gaussian_blur(occupancy[..., None], sigma)[..., 0], out=shadow)
+    return np.clip(shadow, 0, 1)
+
+
+def render_shadow(triangles, resolution, strength=1.0):
+    """
+    Renders the shadow of world space triangles. Returns the (resolution,
+    resolution, 4) RGBA pixels (white is shadow), the covered ground
+    area (x0, y0, size) and the ground height.
+    """
+    bounds, ground = get_shadow_bounds(triangles)
+    heights = rasterize_heights(triangles, bounds, resolution)
+    shadow = blur_heights(heights, ground, bounds[2] / resolution) * strength
+
+    pixels = np.ones((resolution, resolution, 4), dtype=np.float32)
+    pixels[..., :3] = shadow[..., None]
+    return pixels, bounds, ground
+
+
+def get_shadow_table(bounds, ground, origin):
+    """ Formats the SHADOWTABLE line of the area relative to the origin """
+    x0, y0, size = bounds
+    left = to_revolt_scale(x0 - origin[0])
+    right = to_revolt_scale(x0 + size - origin[0])
+    front = to_revolt_scale(y0 + size - origin[1])
+    back = to_revolt_scale(y0 - origin[1])
+    height = to_revolt_scale(ground - origin[2])
+    return ";)SHADOWTABLE {:.4f} {:.4f} {:.4f} {:.4f} {:.4f}".format(left, right, front, back, height)
+
+
+def get_strength(scene):
+    """ Maps the shadow strength slider (1-8) to the shadow intensity """
+    return 0.5 + scene.shadow_strength / 16
+
+
+def bake_shadow(scene, obj):
+    """
+    Renders the shadow of an object and its children into the "shadow"
+    image and sets the scene's shadow table. Returns the image or None.
+    """
+    triangles = get_world_triangles(get_shadow_objects(obj))
+    if not len(triangles):
+        return None
+
+    resolution = int(scene.shadow_resolution)
+    pixels, bounds, ground = render_shadow(triangles, resolution, get_strength(scene))
+
+    image = bpy.data.images.get("shadow")
+    if image is None:
+        image = bpy.data.images.new("shadow", width=resolution, height=resolution, alpha=True)
+    elif tuple(image.size) != (resolution, resolution):
+        image.scale(resolution, resolution)
+    image.pixels.foreach_set(pixels.ravel())
+    image.update()
+
+    scene.shadow_table = get_shadow_table(bounds, ground, obj.matrix_world.translation)
+    return image
@@ -7,62 +7,108 @@ Texture animations are usually contained within world files (.w).
 This module provides an easy way to transfer texture animations from one
 file to another, as well as edit them in an external spread sheet program.
 
+The rows are read one by one and written straight into the scene's
+animation slots. Slots and frames are created up to the highest index
+that is read, so the rows may come in any order.
+
 """
 
 if "common" in locals():
     import imp
     imp.reload(common)
     imp.reload(rvstruct)
+    imp.reload(texanim)
 
+import csv
+import os
+import tempfile
+import time
 from . import common
 from . import rvstruct
+from . import texanim
 
 from .common import *
 
 def import_file(filepath, scene):
 
-    f = open(filepath, "r")
-    lines = f.readlines()
-
-    if not TA_CSV_HEADER in lines[0]:
-        common.queue_error(
-            "reading texture animation file",
-            "File does not include texture animation header."
-        )
-    # Removes the header
-    lines = lines[1:]
-
-    # Resets the texture animations
-    scene.texture_animations = "[]"
-
-    animations = {}
-
-    for line in lines:
-        if line == "\n":
-            continue
-        values = line.split(",")
-        slot_num = int(values[0])
-        frame_num = int(values[1])
-        frame_tex = int(values[2])
-        frame_delay = float(values[3])
-        u0, v0, u1, v1, u2, v2, u3, v3 = [float(c) for c in values[4:12]]
-
-        if not slot_num in animations:
-            animations[slot_num] = rvstruct.TexAnimation()
-
-        frame = rvstruct.Frame()
-        frame.texture = frame_tex
-        frame.delay = frame_delay
-        uv0 = rvstruct.UV(uv=(u0, v0))
-        uv1 = rvstruct.UV(uv=(u1, v1))
-        uv2 = rvstruct.UV(uv=(u2, v2))
-        uv3 = rvstruct.UV(uv=(u3, v3))
-        frame.uv = [uv0, uv1, uv2, uv3]
-
-        animations[slot_num].frames.insert(frame_num, frame)
-
-        animations[slot_num].frame_count = len(animations[slot_num].frames)
-
-    scene.texture_animations = str([a.as_dict() for a in animations.values()])
-
-    scene.ta_max_slots = len(animations)
+    with open(filepath, "r", newline="") as file:
+        reader = csv.reader(file)
+
+        header = next(reader, None)
+        if header is None or not TA_CSV_HEADER in ",".join(header):
+            common.queue_error(
+                "reading texture animation file",
+                "File does not include texture animation header."
+            )
+            return
+
+        # Resets the texture animations
+        scene.texture_animations = "[]"
+        slots = scene.ta_slots
+        slots.clear()
+
+        for values in reader:
+            if not values or not "".join(values).strip():
+                continue
+            slot_num = int(values[0])
+            frame_num = int(values[1])
+            u0, v0, u1, v1, u2, v2, u3, v3 = [float(c) for c in values[4:12]]
+
+            texanim.add_slots(scene, slot_num + 1)
+            slot = slots[slot_num]
+            texanim.add_frames(slot, frame_num + 1)
+            slot.frame_count = max(slot.frame_count, frame_num + 1)
+
+            frame = slot.frames[frame_num]
+            frame.texture = int(values[2])
+            frame.delay = float(values[3])
+            for uv, (u, v) in zip(frame.uv, ((u0, v0), (u1, v1), (u2, v2), (u3, v3))):
+                uv.u = u
+                uv.v = v
+
+    scene.ta_max_slots = len(slots)
+
+
+def benchmark_round_trip(scene, num_slots=TEX_ANIM_MAX, num_frames=64):
+    """
+    Times exporting and importing num_slots x num_frames texture animation
+    frames through a temporary file. The scene's animations are restored
+    afterwards.
+    """
+    from . import ta_csv_out
+
+    animations = texanim.get_animations(scene)
+    max_slots = scene.ta_max_slots
+
+    test_animations = []
+    for s in range(num_slots):
+        anim = rvstruct.TexAnimation()
+        anim.frame_count = num_frames
+        for f in range(num_frames):
+            frame = rvstruct.Frame()
+            frame.texture = s % TEX_PAGES_MAX
+            frame.delay = 0.05
+            frame.uv = [rvstruct.UV(uv=(f / num_frames, i / 4)) for i in range(4)]
+            anim.frames.append(frame)
+        test_animations.append(anim)
+    texanim.set_animations(scene, test_animations)
+    scene.ta_max_slots = num_slots
+
+    handle, filepath = tempfile.mkstemp(suffix=".ta.csv")
+    os.close(handle)
+    try:
+        start = time.time()
+        ta_csv_out.export_file(filepath, scene)
+        export_time = time.time() - start
+
+        start = time.time()
+        import_file(filepath, scene)
+        import_time = time.time() - start
+    finally:
+        os.remove(filepath)
+        texanim.set_animations(scene, animations)
+        scene.ta_max_slots = max_slots
+
+    print("Texture animation CSV with {} slots x {} frames: {:.3f}s export, {:.3f}s import.".format(
+        num_slots, num_frames, export_time, import_time))
+    return export_time, import_time
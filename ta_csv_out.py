@@ -13,6 +13,7 @@ if "common" in locals():
     import imp
     imp.reload(common)
 
+import csv
 from . import common
 from . import texanim
 
@@ -20,28 +21,28 @@ from .common import *
 
 def export_file(filepath, scene):
 
-    ta = eval(scene.texture_animations)
-    lines = [TA_CSV_HEADER]
-
-    for a in range(scene.ta_max_slots):
-        for f in range(ta[a]["frame_count"]):
-            line = "{},{},{},{},{},{},{},{},{},{},{},{}".format(
-                a,
-                f,
-                ta[a]["frames"][f]["texture"],
-                ta[a]["frames"][f]["delay"],
-                ta[a]["frames"][f]["uv"][0]["u"],
-                ta[a]["frames"][f]["uv"][0]["v"],
-                ta[a]["frames"][f]["uv"][1]["u"],
-                ta[a]["frames"][f]["uv"][1]["v"],
-                ta[a]["frames"][f]["uv"][2]["u"],
-                ta[a]["frames"][f]["uv"][2]["v"],
-                ta[a]["frames"][f]["uv"][3]["u"],
-                ta[a]["frames"][f]["uv"][3]["v"],
-            )
-            lines.append(line)
-        lines.append("")
-
-    file = open(filepath, "w")
-    file.write("\n".join(lines))
-    file.close()
+    slots = texanim.get_slots(scene)
+
+    with open(filepath, "w", newline="") as file:
+        file.write(TA_CSV_HEADER + "\n")
+        writer = csv.writer(file, lineterminator="\n")
+
+        for a, slot in enumerate(slots[:scene.ta_max_slots]):
+            for f, frame in enumerate(slot.frames[:slot.frame_count]):
+                uv = frame.uv
+                writer.writerow((
+                    a,
+                    f,
+                    frame.texture,
+                    frame.delay,
+                    uv[0].u,
+                    uv[0].v,
+                    uv[1].u,
+                    uv[1].v,
+                    uv[2].u,
+                    uv[2].v,
+                    uv[3].u,
+                    uv[3].v,
+                ))
+            # Empty line between slots
+            writer.writerow(())
@@ -3,9 +3,12 @@ Name:    texanim
 Purpose: Provides operators and functions for the texture animation panel
 
 Description:
-Moved from operators and panels here to reduce script line amount
+Moved from operators and panels here to reduce script line amount.
+The animations are stored in the scene's ta_slots collection, the panel
+properties only read and write the frame that is being edited.
 """
 
+import ast
 import bmesh
 import bpy
 import os
@@ -15,38 +18,135 @@ from . import rvstruct
 if "common" in locals():
     import importlib
     importlib.reload(common)
+    importlib.reload(rvstruct)
 
 from .common import TEX_PAGES_MAX, get_edit_bmesh, get_active_face, msg_box
 from .common import TEX_ANIM_MAX, int_to_texture
 from .rvstruct import TexAnimation, Frame
 
 
+class TexAnimUV(bpy.types.PropertyGroup):
+    """ A UV coordinate of a frame in Re-Volt space (v is flipped) """
+    u: bpy.props.FloatProperty(name="U")
+    v: bpy.props.FloatProperty(name="V")
+
+
+class TexAnimFrame(bpy.types.PropertyGroup):
+    """ A texture animation frame: texture page, delay and 4 UVs """
+    texture: bpy.props.IntProperty(name="Texture")
+    delay: bpy.props.FloatProperty(name="Delay")
+    uv: bpy.props.CollectionProperty(type=TexAnimUV)
+
+
+class TexAnimSlot(bpy.types.PropertyGroup):
+    """ A texture animation slot. Frames above frame_count are kept but not exported """
+    frame_count: bpy.props.IntProperty(name="Frame Count")
+    frames: bpy.props.CollectionProperty(type=TexAnimFrame)
+
+
+def add_frames(slot, count):
+    """ Adds empty frames to a slot until it has count frames """
+    while len(slot.frames) < count:
+        frame = slot.frames.add()
+        for _ in range(4):
+            frame.uv.add()
+
+
+def add_slots(scene, count):
+    """ Adds empty slots until the scene has count slots """
+    while len(scene.ta_slots) < count:
+        scene.ta_slots.add()
+
+
+def migrate_legacy_animations(scene):
+    """
+    Moves animations of files saved with the old text storage
+    (scene.texture_animations) to the slot collection. The text is only
+    parsed once, it's emptied afterwards.
+    """
+    if scene.texture_animations in {"", "[]"}:
+        return
+    try:
+        animations = ast.literal_eval(scene.texture_animations)
+    except (ValueError, SyntaxError) as e:
+        print("Could not read the texture animations: {}".format(e))
+        animations = []
+
+    anims = []
+    for animdict in animations:
+        anim = TexAnimation()
+        anim.from_dict(animdict)
+        anims.append(anim)
+    set_animations(scene, anims)
+    scene.texture_animations = "[]"
+
+
+def get_slots(scene):
+    """ Gets the texture animation slots of the scene """
+    migrate_legacy_animations(scene)
+    return scene.ta_slots
+
+
+def get_frame(scene, slot, frame):
+    """ Gets a frame of a slot or None if it doesn't exist """
+    slots = get_slots(scene)
+    if slot < 0 or slot >= len(slots) or frame < 0 or frame >= len(slots[slot].frames):
+        return None
+    return slots[slot].frames[frame]
+
+
+def get_animations(scene):
+    """ Gets the texture animations of the scene as rvstruct.TexAnimation """
+    animations = []
+    for slot in get_slots(scene):
+        anim = TexAnimation()
+        anim.frame_count = slot.frame_count
+        for ta_frame in slot.frames:
+            frame = Frame()
+            frame.texture = ta_frame.texture
+            frame.delay = ta_frame.delay
+            frame.uv = [rvstruct.UV(uv=(uv.u, uv.v)) for uv in ta_frame.uv]
+            anim.frames.append(frame)
+        animations.append(anim)
+    return animations
+
+
+def set_animations(scene, animations):
+    """ Replaces the texture animations of the scene with rvstruct.TexAnimations """
+    scene.ta_slots.clear()
+    for anim in animations:
+        slot = scene.ta_slots.add()
+        slot.frame_count = anim.frame_count
+        for frame in anim.frames:
+            ta_frame = slot.frames.add()
+            ta_frame.texture = frame.texture
+            ta_frame.delay = frame.delay
+            for uv in frame.uv:
+                ta_uv = ta_frame.uv.add()
+                ta_uv.u = uv.u
+                ta_uv.v = uv.v
+
+
 def update_ta_max_slots(self, context):
     """Update the maximum number of slots for texture animations."""
     scene = context.scene
     if scene.ta_max_slots > 0:
-        ta = eval(scene.texture_animations)  # Convert string to dictionary
-
+        get_slots(scene)
         # Create new animation slots if needed
-        while len(ta) < scene.ta_max_slots:
-            ta.append(rvstruct.TexAnimation().as_dict())
-
-        scene.texture_animations = str(ta)  # Save the updated texture animations
+        add_slots(scene, scene.ta_max_slots)
 
 def update_ta_max_frames(self, context):
     """Update the maximum number of frames in the current slot."""
     scene = context.scene
-    slot = scene.ta_current_slot
+    slots = get_slots(scene)
+    if scene.ta_current_slot >= len(slots):
+        return
 
-    ta = eval(scene.texture_animations)
-    ta[slot]["frame_count"] = scene.ta_max_frames
+    slot = slots[scene.ta_current_slot]
+    slot.frame_count = scene.ta_max_frames
 
     # Create new frames if necessary
-    while len(ta[slot]["frames"]) < scene.ta_max_frames:
-        new_frame = rvstruct.Frame().as_dict()
-        ta[slot]["frames"].append(new_frame)
-
-    scene.texture_animations = str(ta)  # Save the updated frames
+    add_frames(slot, scene.ta_max_frames)
 
 
 def update_ta_current_slot(self, context):
@@ -54,77 +154,72 @@ def update_ta_current_slot(self, context):
     scene = context.scene
     slot = scene.ta_current_slot
 
-    ta = eval(scene.texture_animations)  # Convert string to dictionary
-
     # Ensure the current slot is within bounds
     if slot > scene.ta_max_slots - 1:
         scene.ta_current_slot = scene.ta_max_slots - 1
         return
 
-    scene.texture_animations = str(ta)  # Save the texture animations
-    scene.ta_max_frames = ta[slot]["frame_count"]  # Update the max frames
+    slots = get_slots(scene)
+    if slot >= len(slots):
+        return
+
+    scene.ta_max_frames = slots[slot].frame_count  # Update the max frames
     update_ta_current_frame(self, context)  # Update the current frame
 
 
 def update_ta_current_frame(self, context):
     """Update the current texture animation frame."""
     scene = context.scene
-    slot = scene.ta_current_slot
-    frame = scene.ta_current_frame
-
-    ta = eval(scene.texture_animations)  # Convert string to dictionary
 
     # Ensure the current frame is within bounds
-    if frame > scene.ta_max_frames - 1:
+    if scene.ta_current_frame > scene.ta_max_frames - 1:
         scene.ta_current_frame = scene.ta_max_frames - 1
         return
 
+    frame = get_frame(scene, scene.ta_current_slot, scene.ta_current_frame)
+    if frame is None:
+        return
+
     # Update the frame's texture and UV coordinates
-    scene.ta_current_frame_tex = ta[slot]["frames"][frame]["texture"]
-    scene.ta_current_frame_delay = ta[slot]["frames"][frame]["delay"]
-    uv = ta[slot]["frames"][frame]["uv"]
-    scene.ta_current_frame_uv0 = (uv[3]["u"], 1 - uv[3]["v"])
-    scene.ta_current_frame_uv1 = (uv[2]["u"], 1 - uv[2]["v"])
-    scene.ta_current_frame_uv2 = (uv[1]["u"], 1 - uv[1]["v"])
-    scene.ta_current_frame_uv3 = (uv[0]["u"], 1 - uv[0]["v"])
+    scene.ta_current_frame_tex = frame.texture
+    scene.ta_current_frame_delay = frame.delay
+    uv = frame.uv
+    scene.ta_current_frame_uv0 = (uv[3].u, 1 - uv[3].v)
+    scene.ta_current_frame_uv1 = (uv[2].u, 1 - uv[2].v)
+    scene.ta_current_frame_uv2 = (uv[1].u, 1 - uv[1].v)
+    scene.ta_current_frame_uv3 = (uv[0].u, 1 - uv[0].v)
 
 
 def update_ta_current_frame_tex(self, context):
     """Update the texture of the current frame."""
     scene = context.scene
-    slot = scene.ta_current_slot
-    frame = scene.ta_current_frame
-
-    ta = eval(scene.texture_animations)
-    ta[slot]["frames"][frame]["texture"] = scene.ta_current_frame_tex  # Update texture
-    scene.texture_animations = str(ta)  # Save the updated texture animations
+    frame = get_frame(scene, scene.ta_current_slot, scene.ta_current_frame)
+    if frame is not None and frame.texture != scene.ta_current_frame_tex:
+        frame.texture = scene.ta_current_frame_tex
 
 
 def update_ta_current_frame_delay(self, context):
     """Update the delay of the current frame."""
     scene = context.scene
-    slot = scene.ta_current_slot
-    frame = scene.ta_current_frame
-
-    ta = eval(scene.texture_animations)
-    ta[slot]["frames"][frame]["delay"] = scene.ta_current_frame_delay  # Update delay
-    scene.texture_animations = str(ta)  # Save the updated texture animations
+    frame = get_frame(scene, scene.ta_current_slot, scene.ta_current_frame)
+    if frame is not None and frame.delay != scene.ta_current_frame_delay:
+        frame.delay = scene.ta_current_frame_delay
 
 
 def update_ta_current_frame_uv(context, num):
     """Update the UV coordinates of the current frame."""
     scene = bpy.context.scene
     prop_str = f"ta_current_frame_uv{num}"
-    slot = scene.ta_current_slot
-    frame = scene.ta_current_frame
+    frame = get_frame(scene, scene.ta_current_slot, scene.ta_current_frame)
+    if frame is None:
+        return
 
     # Reverse the accessor since they're saved in reverse order
     num = [0, 1, 2, 3][::-1][num]
 
-    ta = eval(scene.texture_animations)
-    ta[slot]["frames"][frame]["uv"][num]["u"] = getattr(scene, prop_str)[0]
-    ta[slot]["frames"][frame]["uv"][num]["v"] = 1 - getattr(scene, prop_str)[1]
-    scene.texture_animations = str(ta)  # Save the updated UVs
+    uv = frame.uv[num]
+    uv.u = getattr(scene, prop_str)[0]
+    uv.v = 1 - getattr(scene, prop_str)[1]
 
 def copy_uv_to_frame(context):
     scene = context.scene
@@ -0,0 +1,345 @@
+"""
+Name:    texatlas
+Purpose: Packs the used regions of texture pages into fewer pages
+
+Description:
+Analyzes which parts of each texture page are used by the UVs of the
+scene's meshes and texture animation frames, packs these regions onto
+new pages and remaps UVs, texture numbers and animation frames.
+
+"""
+
+import bpy
+import os
+import numpy as np
+from . import common
+from . import prm_out
+from . import img_in
+from . import texanim
+
+if "common" in locals():
+    import importlib
+    importlib.reload(common)
+    importlib.reload(prm_out)
+    importlib.reload(img_in)
+    importlib.reload(texanim)
+
+from .common import TEX_PAGES_MAX, FACE_TEXANIM, texture_to_int
+from .tools import get_slot_index
+
+# Pixels around each packed region to avoid bleeding from neighbors
+ATLAS_PADDING = 2
+
+
+def get_page_images(objects):
+    """ Gets the image of each texture page used by the objects """
+    pages = {}
+    for obj in objects:
+        for i in range(len(obj.material_slots)):
+            image = prm_out.find_slot_image(obj, i)
+            if image is None:
+                continue
+            page = texture_to_int(image.name)
+            if 0 <= page < TEX_PAGES_MAX:
+                pages.setdefault(page, image)
+    return pages
+
+
+def get_face_pages(obj):
+    """
+    Gets the texture page of each face (-1 for untextured and animated
+    faces), read with foreach_get.
+    """
+    me = obj.data
+    slot_pages = []
+    for i in range(len(obj.material_slots)):
+        image = prm_out.find_slot_image(obj, i)
+        page = texture_to_int(image.name) if image else -1
+        slot_pages.append(page if page < TEX_PAGES_MAX else -1)
+    slot_pages = np.array(slot_pages + [-1], dtype=np.int64)
+
+    num_faces = len(me.polygons)
+    material_indices = np.empty(num_faces, dtype=np.int64)
+    me.polygons.foreach_get("material_index", material_indices)
+    material_indices = np.clip(material_indices, 0, len(slot_pages) - 1)
+    face_pages = slot_pages[material_indices]
+
+    # Animated faces get their UVs from the animation frames
+    face_types = prm_out.get_face_values(me, "Type", np.int64, 0)
+    face_pages[(face_types & FACE_TEXANIM) != 0] = -1
+    return face_pages
+
+
+def get_loop_faces(me):
+    """ Gets the face index of every loop """
+    num_faces = len(me.polygons)
+    loop_starts = np.empty(num_faces, dtype=np.int64)
+    loop_totals = np.empty(num_faces, dtype=np.int64)
+    me.polygons.foreach_get("loop_start", loop_starts)
+    me.polygons.foreach_get("loop_total", loop_totals)
+
+    loop_faces = np.empty(len(me.loops), dtype=np.int64)
+    offsets = np.arange(loop_totals.sum()) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    loop_faces[np.repeat(loop_starts, loop_totals) + offsets] = np.repeat(np.arange(num_faces), loop_totals)
+    return loop_faces
+
+
+def get_mesh_uvs(me):
+    """ Gets the UVMap layer as a (loops, 2) array or None """
+    uv_layer = me.uv_layers.get("UVMap")
+    if uv_layer is None:
+        return None
+    uvs = np.empty(len(me.loops) * 2, dtype=np.float64)
+    uv_layer.data.foreach_get("uv", uvs)
+    return uvs.reshape(-1, 2)
+
+
+def get_frame_uvs(frame):
+    """ Gets the UVs of an animation frame in Blender space """
+    return np.array([(uv.u, 1 - uv.v) for uv in frame.uv], dtype=np.float64)
+
+
+class PageUsage:
+    """
+    Collects the UV bounds used on a texture page. Pages with UVs outside
+    of 0-1 (tiling) can't be packed and are kept whole.
+    """
+    def __init__(self, image):
+        self.image = image
+        self.width, self.height = image.size
+        self.lo = np.array([np.inf, np.inf])
+        self.hi = np.array([-np.inf, -np.inf])
+        self.tiled = False
+
+    def add(self, uvs):
+        if not len(uvs):
+            return
+        self.lo = np.minimum(self.lo, uvs.min(axis=0))
+        self.hi = np.maximum(self.hi, uvs.max(axis=0))
+        if np.any(uvs < -1e-4) or np.any(uvs > 1 + 1e-4):
+            self.tiled = True
+
+    def get_rect(self):
+        """ Gets the used pixel region (x0, y0, x1, y1) including padding """
+        if self.tiled:
+            return 0, 0, self.width, self.height
+        size = np.array([self.width, self.height])
+        lo = np.clip(np.floor(self.lo * size).astype(int) - ATLAS_PADDING, 0, size)
+        hi = np.clip(np.ceil(self.hi * size).astype(int) + ATLAS_PADDING, 0, size)
+        return int(lo[0]), int(lo[1]), int(hi[0]), int(hi[1])
+
+
+def pack_rects(rects, size):
+    """
+    Packs (width, height) rectangles onto pages of size x size pixels with
+    shelf packing (tallest first). Returns a (page, x, y) per rectangle.
+    """
+    order = sorted(range(len(rects)), key=lambda i: (-rects[i][1], -rects[i][0]))
+    placements = [None] * len(rects)
+    page = -1
+    shelf_x = shelf_y = shelf_height = size
+
+    for i in order:
+        width, height = rects[i]
+        if shelf_x + width > size:
+            # Starts a new shelf, or a new page if it doesn't fit
+            shelf_y += shelf_height
+            shelf_x = 0
+            shelf_height = height
+            if shelf_y + height > size:
+                page += 1
+                shelf_y = 0
+        placements[i] = (page, shelf_x, shelf_y)
+        shelf_x += width
+
+    return placements
+
+
+def get_image_pixels(image):
+    """ Gets the pixels of an image as a (height, width, 4) float array """
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
+
+
+def get_loaded_files():
+    """
+    Gets the normalized paths of the files of all images, including images
+    decoded by the add-on, which keep the path of their file.
+    """
+    return {os.path.normcase(os.path.abspath(bpy.path.abspath(image.filepath)))
+            for image in bpy.data.images if image.filepath}
+
+
+def create_page_material(name, image):
+    """
+    Creates a new texture material for a packed page. Existing materials
+    of the old pages are left alone, faces that weren't remapped still
+    use them.
+    """
+    material = bpy.data.materials.new(name=name)
+    material.use_nodes = True
+    bsdf = material.node_tree.nodes.get('Principled BSDF')
+    tex_image = material.node_tree.nodes.new('ShaderNodeTexImage')
+    tex_image.image = image
+    material.node_tree.links.new(bsdf.inputs['Base Color'], tex_image.outputs['Color'])
+    return material
+
+
+def pack_texture_pages(scene, directory):
+    """
+    Packs the used regions of all texture pages of the scene onto as few
+    pages as possible. The new pages are saved as bitmaps to the directory
+    and all faces and texture animation frames are remapped.
+    Returns (pages before, pages after) or None if nothing was packed.
+    Raises a ValueError if a new page would overwrite a file an image is
+    loaded from (e.g. the original pages in the track folder).
+    """
+    objects = [obj for obj in scene.objects if obj.type == 'MESH' and obj.data]
+    pages = get_page_images(objects)
+    if not pages:
+        print("No texture pages found.")
+        return None
+
+    # Packs from the full resolution files, not the previews
+    for image in pages.values():
+        img_in.restore_full_resolution(image)
+
+    usage = {page: PageUsage(image) for page, image in pages.items()}
+
+    # UV usage of the faces. Meshes without UVs are only renumbered.
+    meshes = {}
+    num_animated = 0
+    for obj in objects:
+        if obj.data.name in meshes:
+            continue
+        uvs = get_mesh_uvs(obj.data)
+        face_pages = get_face_pages(obj)
+        face_types = prm_out.get_face_values(obj.data, "Type", np.int64, 0)
+        num_animated += np.count_nonzero(face_types & FACE_TEXANIM)
+        if uvs is None:
+            meshes[obj.data.name] = (obj, face_pages, None, None)
+            continue
+        loop_pages = face_pages[get_loop_faces(obj.data)]
+        meshes[obj.data.name] = (obj, face_pages, loop_pages, uvs)
+        for page in np.unique(face_pages):
+            if page in usage:
+                usage[page].add(uvs[loop_pages == page])
+
+    # UV usage of the texture animation frames
+    slots = texanim.get_slots(scene)
+    for slot in slots:
+        for frame in slot.frames[:slot.frame_count]:
+            if frame.texture in usage:
+                usage[frame.texture].add(get_frame_uvs(frame))
+
+    used_pages = sorted(page for page, u in usage.items() if np.isfinite(u.lo).all())
+    if not used_pages:
+        return None
+
+    # Packs the used regions onto pages of the largest page size
+    size = max(max(usage[page].width, usage[page].height) for page in used_pages)
+    packable = [page for page in used_pages if not usage[page].tiled
+                and usage[page].width <= size and usage[page].height <= size]
+    rects = {page: usage[page].get_rect() for page in packable}
+    placements = pack_rects([(r[2] - r[0], r[3] - r[1]) for r in rects.values()], size)
+    num_packed = max((p[0] for p in placements), default=-1) + 1
+
+    # Tiled pages stay whole and get the page numbers after the packed ones
+    kept = [page for page in used_pages if page not in rects]
+    num_pages = num_packed + len(kept)
+    if num_pages >= len(used_pages):
+        print("Texture pages can't be packed any further ({} pages).".format(len(used_pages)))
+        return None
+
+    # Names the pages like the first one (e.g. "track" for tracka.bmp)
+    base = os.path.splitext(pages[used_pages[0]].name)[0][:-1]
+    names = [common.int_to_texture(new_page, base) for new_page in range(num_pages)]
+
+    # The original pages are kept, they must not be overwritten
+    loaded_files = get_loaded_files()
+    conflicts = [name for name in names
+                 if os.path.normcase(os.path.abspath(os.path.join(directory, name))) in loaded_files]
+    if conflicts:
+        raise ValueError("{} would overwrite the original texture pages, "
+                         "please choose another folder.".format(", ".join(conflicts)))
+
+    # Old page -> (new page, offset in pixels, source size, new page size)
+    mapping = {}
+    for page, (new_page, x, y) in zip(rects, placements):
+        x0, y0, x1, y1 = rects[page]
+        mapping[page] = (new_page, (x - x0, y - y0), (usage[page].width, usage[page].height), (size, size))
+    for i, page in enumerate(kept):
+        page_size = (usage[page].width, usage[page].height)
+        mapping[page] = (num_packed + i, (0, 0), page_size, page_size)
+
+    # Builds the new bitmaps
+    atlases = [np.zeros((size, size, 4), dtype=np.float32) for _ in range(num_packed)]
+    for page, (new_page, x, y) in zip(rects, placements):
+        x0, y0, x1, y1 = rects[page]
+        pixels = get_image_pixels(usage[page].image)
+        atlases[new_page][y:y + y1 - y0, x:x + x1 - x0] = pixels[y0:y1, x0:x1]
+    atlases.extend(get_image_pixels(usage[page].image) for page in kept)
+
+    for image in pages.values():
+        image.name = "{}_orig".format(os.path.splitext(image.name)[0])
+
+    materials = []
+    for name, pixels in zip(names, atlases):
+        height, width = pixels.shape[:2]
+        image = bpy.data.images.new(name, width, height, alpha=True)
+        image.pixels.foreach_set(pixels.ravel())
+        image.filepath_raw = os.path.join(directory, name)
+        image.file_format = 'BMP'
+        image.save()
+        image.use_fake_user = True
+        materials.append(create_page_material(name, image))
+
+    # Remaps the faces: material, texture number and UVs
+    num_without_uvs = 0
+    for obj, face_pages, loop_pages, uvs in meshes.values():
+        me = obj.data
+        num_faces = len(me.polygons)
+        material_indices = np.empty(num_faces, dtype=np.int64)
+        me.polygons.foreach_get("material_index", material_indices)
+        tex_nums = prm_out.get_face_values(me, "Texture Number", np.int64, -1)
+
+        for page, (new_page, offset, src_size, dst_size) in mapping.items():
+            faces = face_pages == page
+            if not np.any(faces):
+                continue
+            material_indices[faces] = get_slot_index(me, materials[new_page])
+            tex_nums[faces] = new_page
+            if uvs is None:
+                num_without_uvs += np.count_nonzero(faces)
+                continue
+            loops = loop_pages == page
+            uvs[loops] = (uvs[loops] * src_size + offset) / dst_size
+
+        me.polygons.foreach_set("material_index", material_indices)
+        texnum_attr = me.attributes.get("Texture Number") or me.attributes.new("Texture Number", 'INT', 'FACE')
+        texnum_attr.data.foreach_set("value", tex_nums)
+        if uvs is not None:
+            me.uv_layers["UVMap"].data.foreach_set("uv", uvs.ravel())
+        me.update()
+
+    # Remaps the texture animation frames
+    for slot in slots:
+        for frame in slot.frames:
+            if frame.texture not in mapping:
+                continue
+            new_page, offset, src_size, dst_size = mapping[frame.texture]
+            frame_uvs = (get_frame_uvs(frame) * src_size + offset) / dst_size
+            frame.texture = new_page
+            for uv, (u, v) in zip(frame.uv, frame_uvs):
+                uv.u = float(u)
+                uv.v = float(1 - v)
+
+    if num_without_uvs:
+        print("{} faces without a UVMap got new pages but no UVs.".format(num_without_uvs))
+    if num_animated:
+        print("{} animated faces were left as they are, their UVs and pages "
+              "come from the animation frames.".format(num_animated))
+    print("Packed {} texture pages into {}.".format(len(used_pages), num_pages))
+    return len(used_pages), num_pages
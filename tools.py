@@ -13,6 +13,7 @@ import bpy
 import bmesh
 import mathutils
 import re
+import numpy as np
 from math import pi
 import time
 from . import common
@@ -247,20 +248,206 @@ def set_high_flag(self, value):
     """Set the high flag value."""
     self["flag_high"] = int(value)
     
+MATERIAL_SUFFIXES = {
+    'UV_TEX': '_UVTex',
+    'COL': '_Col',
+    'ALPHA': '_Alpha',
+    'ENV': '_Env',
+    'RGB': '_RGBModelColor'
+}
+
+CAR_PART_PREFIXES = ["body", "wheel", "axle", "spring", "pin"]
+
+
+def get_material_base_name(obj):
+    """ Gets the base name used for the layer materials of an object """
+    base_name = obj.name.split('.')[0]
+    extension = ""
+
+    specific_keywords = ["body", "wheel", "axle", "spring"]
+    filtered_parts = [part for part in obj.name.split('_') if any(keyword in part for keyword in specific_keywords)]
+
+    if ".w" in obj.name:
+        extension = ".w"
+    elif ".prm" in obj.name or ".m" in obj.name or filtered_parts:
+        extension = ".prm" if ".prm" in obj.name else ".m"
+
+    return f"{base_name}{extension}"
+
+
+def build_material_maps():
+    """
+    Scans the materials and images of the file once. Returns the lookups
+    needed by assign_materials (same rules as the assign_materials_auto
+    operator): material names, the texture base name per page suffix and
+    caches for texture and layer materials.
+    """
+    texture_bases = {}
+    for image in bpy.data.images:
+        name_parts = image.name.rsplit('.', 1)
+        if len(name_parts) > 1 and name_parts[-1].isalpha() and name_parts[0]:
+            # The first image ending with the page letter defines the base name
+            texture_bases.setdefault(name_parts[0][-1], name_parts[0][:-1])
+
+    return {
+        "materials": {mat.name: mat for mat in bpy.data.materials},
+        "texture_bases": texture_bases,
+        "texture_materials": {},
+        "layer_materials": {},
+    }
+
+
+def get_texture_material(maps, tex_num, is_car_part):
+    """ Resolves the texture material of a texture number (or None) """
+    key = -1 if is_car_part else tex_num
+    texture_materials = maps["texture_materials"]
+    if key in texture_materials:
+        return texture_materials[key]
+
+    if is_car_part:
+        material_name = "car.bmp"
+    else:
+        suffix = chr(97 + tex_num)
+        base = maps["texture_bases"].get(suffix)
+        material_name = f"{base}{suffix}.bmp" if base is not None else None
+
+    material = maps["materials"].get(material_name) if material_name else None
+    texture_materials[key] = material
+    return material
+
+
+def get_layer_material(maps, base_name, material_suffix):
+    """ Resolves the layer material (e.g. name.prm_Col) of a base name """
+    key = (base_name, material_suffix)
+    layer_materials = maps["layer_materials"]
+    if key in layer_materials:
+        return layer_materials[key]
+
+    materials = maps["materials"]
+    material = materials.get(f"{base_name}{material_suffix}")
+
+    # Tries without numbers (e.g., "spring.prm_Col") and the generic material
+    if not material:
+        base_name_no_number = ''.join([i for i in base_name if not i.isdigit()])
+        material = materials.get(f"{base_name_no_number}{material_suffix}")
+    if not material:
+        material = materials.get(material_suffix)
+
+    layer_materials[key] = material
+    return material
+
+
+def get_slot_index(me, material):
+    """ Gets the slot index of a material, appends it to the mesh if needed """
+    index = me.materials.find(material.name)
+    if index == -1:
+        me.materials.append(material)
+        index = len(me.materials) - 1
+    return index
+
+
+def assign_materials(objects, choices=('COL', 'UV_TEX'), maps=None):
+    """
+    Assigns the layer and texture materials to all faces of the given
+    objects through the data API. The choices are applied in order, so
+    ('COL', 'UV_TEX') assigns the texture materials and falls back to the
+    vertex color material for untextured faces.
+    Objects must be in Object mode. Objects sharing a mesh are only
+    processed once.
+    """
+    if not objects:
+        print("No mesh objects selected for material assignment.")
+        return
+
+    if maps is None:
+        maps = build_material_maps()
+
+    done = set()
+    for obj in objects:
+        if obj.type != 'MESH' or obj.data is None:
+            continue
+        me = obj.data
+        if me.name in done:
+            continue
+        done.add(me.name)
+
+        num_faces = len(me.polygons)
+        material_indices = np.empty(num_faces, dtype=np.int32)
+        me.polygons.foreach_get("material_index", material_indices)
+
+        for choice in choices:
+            if choice == 'UV_TEX':
+                texnum_attr = me.attributes.get("Texture Number")
+                if texnum_attr is None or not num_faces:
+                    continue
+                tex_nums = np.empty(num_faces, dtype=np.int32)
+                texnum_attr.data.foreach_get("value", tex_nums)
+
+                is_car_part = any(obj.name.startswith(prefix) for prefix in CAR_PART_PREFIXES)
+                for tex_num in np.unique(tex_nums):
+                    if tex_num == -1:
+                        continue
+                    material = get_texture_material(maps, int(tex_num), is_car_part)
+                    if material is None:
+                        continue
+                    material_indices[tex_nums == tex_num] = get_slot_index(me, material)
+            else:
+                suffix = MATERIAL_SUFFIXES.get(choice, '_Col')
+                material = get_layer_material(maps, get_material_base_name(obj), suffix)
+                if material is None:
+                    print(f"Material {get_material_base_name(obj)}{suffix} not found.")
+                    continue
+                material_indices.fill(get_slot_index(me, material))
+
+        me.polygons.foreach_set("material_index", material_indices)
+        me.material_choice = choices[-1]
+        me.update()
+
+    print(f"Assigned materials ({', '.join(choices)}) to {len(done)} meshes.")
+
+
 def set_material_to_col_for_object(obj):
     """Sets the material to Vertex Colour (_Col) for a specific object."""
-    bpy.context.view_layer.objects.active = obj
-    obj.data.material_choice = 'COL'
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.object.assign_materials_auto()
-    bpy.ops.object.mode_set(mode='OBJECT')
+    assign_materials([obj], ('COL',))
 
 def set_material_to_texture_for_object(obj):
     """Sets the material to Texture (UV_TEX) for a specific object."""
-    bpy.context.view_layer.objects.active = obj
-    obj.data.material_choice = 'UV_TEX'
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.object.assign_materials_auto()
-    bpy.ops.object.mode_set(mode='OBJECT')
\ No newline at end of file
+    assign_materials([obj], ('UV_TEX',))
+
+
+def get_corner_colors(me, name):
+    """ Gets a color layer as (loops, 4) floats, byte colors unconverted """
+    attr = me.color_attributes[name]
+    values = np.empty(len(attr.data) * 4, dtype=np.float32)
+    prop = "color_srgb" if attr.data_type == 'BYTE_COLOR' else "color"
+    attr.data.foreach_get(prop, values)
+    return values.reshape(-1, 4)
+
+
+def set_corner_colors(me, name, values):
+    attr = me.color_attributes[name]
+    prop = "color_srgb" if attr.data_type == 'BYTE_COLOR' else "color"
+    attr.data.foreach_set(prop, np.ascontiguousarray(values, dtype=np.float32).ravel())
+
+
+def blend_baked_colors(me, layer_name, ao_name, direct_name, shadow_strength, light_strength, keep_alpha=False):
+    """
+    Blends baked AO and direct light layers into a vertex color layer:
+    color * (1 - shadow * (1 - ao)) + light * direct, for all loops at once.
+    The alpha is set to 1 unless keep_alpha is set.
+    """
+    colors = get_corner_colors(me, layer_name)
+    ao = get_corner_colors(me, ao_name)[:, :3]
+    direct = get_corner_colors(me, direct_name)[:, :3]
+    blend_light(colors, ao, direct, shadow_strength, light_strength, keep_alpha)
+    set_corner_colors(me, layer_name, colors)
+    me.update()
+
+
+def blend_light(colors, ao, direct, shadow_strength, light_strength, keep_alpha=False):
+    """ Blends AO and direct light into (loops, 4) colors in place """
+    colors[:, :3] *= 1 - shadow_strength * (1 - ao)
+    colors[:, :3] += light_strength * direct
+    np.clip(colors[:, :3], 0.0, 1.0, out=colors[:, :3])
+    if not keep_alpha:
+        colors[:, 3] = 1.0
@@ -54,4 +54,6 @@ class RVIO_PT_RevoltHelpersPanelMesh(bpy.types.Panel):
 
         box = layout.box()
         box.label(text="Texture tools:")
-        box.operator("helpers.textures_save")
\ No newline at end of file
+        box.operator("helpers.textures_save")
+        box.operator("helpers.textures_pack_atlas")
+        box.operator("helpers.textures_full_resolution")
\ No newline at end of file
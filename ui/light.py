@@ -29,9 +29,12 @@ class RVIO_PT_RevoltLightPanel(bpy.types.Panel):
         layout.operator("object.bake_vertex", text="Bake Light to Vertex Colours")
         layout.operator("object.batch_bake_vertex_to_env", text="Batch Bake Light to .fin Env")
         layout.operator("object.bake_vertex_to_rgbmodelcolor", text="Bake Light to RGB Model")
+        layout.operator("object.bake_vertex_cpu", text="Bake Light to Vertex Colours (CPU)")
         box = layout.box()
         col = box.column(align=True)
-        col.prop(scene, "shadow_quality")
+        col.prop(scene, "shadow_engine")
+        if scene.shadow_engine == 'CYCLES':
+            col.prop(scene, "shadow_quality")
         col.prop(scene, "shadow_resolution")
         col.prop(scene, "shadow_strength")
         col.operator("lighttools.bake_shadow")
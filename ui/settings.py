@@ -20,8 +20,13 @@ class RVIO_PT_RevoltSettingsPanel(bpy.types.Panel):
         if scene.export_worldcut:
             layout.prop(scene, "split_size_faces", slider=True)
             layout.label(text="Actual Split Size: {}".format(scene.actual_split_size))
+        layout.prop(scene, "bigcube_mode")
+        if scene.bigcube_mode != 'SINGLE':
+            layout.prop(scene, "bigcube_count")
         layout.prop(scene, "triangulate_ngons", text="Triangluate Ngons")
         layout.prop(scene, "use_tex_num", text="Export w/o Texture")
+        layout.prop(scene, "sort_polygons", text="Sort Polygons by Texture")
+        layout.prop(scene, "optimize_vertex_cache", text="Optimize Vertex Cache")
         layout.prop(scene, "apply_scale", text="Apply Scale")
         layout.prop(scene, "apply_rotation", text= "Apply Rotation (disable for axle/pin/spring)")
         layout.prop(scene, "apply_translation", text= "Apply Translation")
@@ -30,6 +35,14 @@ class RVIO_PT_RevoltSettingsPanel(bpy.types.Panel):
         # PRM Export settings
         layout.label(text="Export Car (.prm):")
         layout.prop(scene, "export_camber", text="Copy Wheel Camber")
+        layout.prop(scene, "prm_generate_lods")
+        if scene.prm_generate_lods:
+            layout.prop(scene, "prm_lod_ratios")
+        layout.separator()
+
+        # Import settings
+        layout.label(text="Import:")
+        layout.prop(scene, "texture_proxy")
         layout.separator()
 
         # World Import settings
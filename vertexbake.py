@@ -0,0 +1,217 @@
+"""
+Name:    vertexbake
+Purpose: Bakes ambient occlusion and light to vertex colors without Cycles
+
+Description:
+Rays are cast from every vertex against a BVH tree of the visible scene
+meshes. Ambient occlusion uses a fixed cosine-weighted hemisphere of
+directions around the vertex normal, direct light uses one shadow ray per
+sun or point light. The ray directions are prepared with NumPy for chunks
+of vertices, the ray casts themselves run in the BVH tree.
+Works in background mode, no GPU or render engine is needed.
+
+"""
+
+import time
+import numpy as np
+from math import pi
+from mathutils.bvhtree import BVHTree
+from . import tools
+
+if "tools" in locals():
+    import importlib
+    importlib.reload(tools)
+
+# Vertices whose rays are prepared at once
+BAKE_CHUNK_SIZE = 4096
+
+# Ray origins are moved off the surface by this fraction of the scene size
+RAY_OFFSET = 1e-4
+
+# Golden angle used to spread the hemisphere directions
+GOLDEN_ANGLE = pi * (3 - 5 ** 0.5)
+
+
+def get_world_vertices(obj):
+    """ Gets the world space positions and normals of an object's vertices """
+    me = obj.data
+    num_verts = len(me.vertices)
+    positions = np.empty(num_verts * 3, dtype=np.float64)
+    normals = np.empty(num_verts * 3, dtype=np.float64)
+    me.vertices.foreach_get("co", positions)
+    me.vertices.foreach_get("normal", normals)
+
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    positions = positions.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = normals.reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths > 0, lengths, 1)
+    return positions, normals
+
+
+def get_polygon_indices(me, offset=0):
+    """ Gets the vertex indices of every polygon as lists """
+    loop_verts = np.empty(len(me.loops), dtype=np.int64)
+    loop_totals = np.empty(len(me.polygons), dtype=np.int64)
+    me.loops.foreach_get("vertex_index", loop_verts)
+    me.polygons.foreach_get("loop_total", loop_totals)
+    return [poly.tolist() for poly in np.split(loop_verts + offset, np.cumsum(loop_totals)[:-1])]
+
+
+def build_scene_bvh(objects):
+    """ Builds a world space BVH tree of the given mesh objects """
+    positions = []
+    polygons = []
+    offset = 0
+    for obj in objects:
+        if not len(obj.data.polygons):
+            continue
+        obj_positions, _ = get_world_vertices(obj)
+        positions.append(obj_positions)
+        polygons.extend(get_polygon_indices(obj.data, offset))
+        offset += len(obj_positions)
+
+    if not positions:
+        return None, 0.0
+    positions = np.concatenate(positions)
+    size = float(np.linalg.norm(positions.max(axis=0) - positions.min(axis=0)))
+    return BVHTree.FromPolygons(positions.tolist(), polygons), size
+
+
+def get_hemisphere_directions(count):
+    """
+    Gets count cosine-weighted directions around +Z, spread evenly with a
+    Fibonacci spiral so the result is the same on every bake.
+    """
+    u = (np.arange(count) + 0.5) / count
+    radius = np.sqrt(u)
+    angle = np.arange(count) * GOLDEN_ANGLE
+    return np.column_stack((radius * np.cos(angle), radius * np.sin(angle), np.sqrt(1 - u)))
+
+
+def get_tangent_frames(normals):
+    """ Gets two tangents perpendicular to each normal """
+    helpers = np.where(np.abs(normals[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    tangents = np.cross(normals, helpers)
+    tangents /= np.linalg.norm(tangents, axis=1, keepdims=True)
+    return tangents, np.cross(normals, tangents)
+
+
+def bake_ambient_occlusion(bvh, positions, normals, samples, distance, offset):
+    """ Gets the unoccluded fraction (0-1) of the hemisphere of each vertex """
+    directions = get_hemisphere_directions(samples)
+    ao = np.ones(len(positions))
+
+    for start in range(0, len(positions), BAKE_CHUNK_SIZE):
+        chunk = slice(start, start + BAKE_CHUNK_SIZE)
+        chunk_normals = normals[chunk]
+        tangents, bitangents = get_tangent_frames(chunk_normals)
+
+        # (vertices, samples, 3) world directions
+        rays = (directions[None, :, :1] * tangents[:, None] +
+                directions[None, :, 1:2] * bitangents[:, None] +
+                directions[None, :, 2:] * chunk_normals[:, None])
+        origins = (positions[chunk] + chunk_normals * offset).tolist()
+
+        hits = np.zeros(len(origins))
+        for i, (origin, vertex_rays) in enumerate(zip(origins, rays.tolist())):
+            hits[i] = sum(bvh.ray_cast(origin, ray, distance)[0] is not None for ray in vertex_rays)
+        ao[chunk] = 1 - hits / samples
+
+    return ao
+
+
+def get_scene_lights(scene):
+    """
+    Gets the lights of the scene as (direction or position, color, is_sun).
+    Spot and area lights are treated as point lights.
+    """
+    lights = []
+    for obj in scene.objects:
+        if obj.type != 'LIGHT' or obj.hide_render:
+            continue
+        light = obj.data
+        color = np.array(light.color) * light.energy
+        if light.type == 'SUN':
+            direction = np.array(obj.matrix_world.to_3x3().col[2])
+            lights.append((direction / np.linalg.norm(direction), color, True))
+        else:
+            # Irradiance of a point light in Cycles: P / (4 pi^2 r^2)
+            lights.append((np.array(obj.matrix_world.translation), color / (4 * pi * pi), False))
+    return lights
+
+
+def bake_direct_light(bvh, positions, normals, lights, offset):
+    """ Gets the shadowed diffuse light (vertices, 3) of each vertex """
+    direct = np.zeros((len(positions), 3))
+    origins = positions + normals * offset
+
+    for vector, color, is_sun in lights:
+        if is_sun:
+            to_light = np.broadcast_to(vector, positions.shape)
+            distances = np.full(len(positions), np.inf)
+        else:
+            to_light = vector - origins
+            distances = np.linalg.norm(to_light, axis=1)
+            to_light = to_light / np.maximum(distances, 1e-9)[:, None]
+
+        lambert = np.einsum('ij,ij->i', normals, to_light)
+        falloff = 1.0 if is_sun else 1 / np.maximum(distances, 1e-9) ** 2
+
+        # Only vertices facing the light need a shadow ray
+        lit = lambert > 0
+        for i in np.flatnonzero(lit):
+            distance = distances[i] if np.isfinite(distances[i]) else 1e10
+            if bvh.ray_cast(origins[i].tolist(), to_light[i].tolist(), distance)[0] is not None:
+                lit[i] = False
+        direct += np.where(lit, lambert * falloff, 0)[:, None] * color
+
+    return direct
+
+
+def bake_objects(scene, objects, layer_name='Col', samples=16, distance=1.0,
+                 shadow_strength=1.0, light_strength=0.5):
+    """
+    Bakes AO and direct light of the scene lights into a color layer of
+    each object. The whole visible scene casts shadows.
+    Returns the number of baked vertices.
+    """
+    start = time.time()
+    occluders = [obj for obj in scene.objects if obj.type == 'MESH' and obj.data and obj.visible_get()]
+    bvh, size = build_scene_bvh(occluders)
+    if bvh is None:
+        return 0
+    offset = size * RAY_OFFSET
+    lights = get_scene_lights(scene)
+    print("Built BVH of {} objects in {:.3f} seconds.".format(len(occluders), time.time() - start))
+
+    num_baked = 0
+    for obj in objects:
+        if obj.type != 'MESH' or not obj.data or not len(obj.data.vertices):
+            continue
+        bake_start = time.time()
+        me = obj.data
+        positions, normals = get_world_vertices(obj)
+
+        ao = bake_ambient_occlusion(bvh, positions, normals, samples, distance, offset)
+        direct = bake_direct_light(bvh, positions, normals, lights, offset)
+
+        # Vertex values to the loops of the color layer
+        layer = me.color_attributes.get(layer_name)
+        if layer is None:
+            layer = me.color_attributes.new(layer_name, 'BYTE_COLOR', 'CORNER')
+        if layer.domain == 'CORNER':
+            loop_verts = np.empty(len(me.loops), dtype=np.int64)
+            me.loops.foreach_get("vertex_index", loop_verts)
+        else:
+            loop_verts = np.arange(len(positions))
+        colors = tools.get_corner_colors(me, layer_name)
+        tools.blend_light(colors, ao[loop_verts, None], direct[loop_verts], shadow_strength,
+                          light_strength, keep_alpha=layer_name == 'Env')
+        tools.set_corner_colors(me, layer_name, colors)
+        me.update()
+
+        num_baked += len(positions)
+        print("Baked {} ({} vertices) in {:.3f} seconds.".format(obj.name, len(positions), time.time() - bake_start))
+
+    return num_baked
@@ -14,8 +14,10 @@ from . import common
 from . import rvstruct
 from . import img_in
 from . import prm_in
+from . import texanim
 
 from .rvstruct import World
+from .tools import assign_materials
 from .common import int_to_texture, msg_box, to_blender_coord, COL_BBOX, create_material, to_blender_scale, COL_BCUBE, COL_CUBE
 
 if "bpy" in locals():
@@ -43,15 +45,18 @@ def import_file(filepath, scene):
 
     meshes = world.meshes
     print("Imported {} ({} meshes)".format(filename, len(meshes)))
+    prm_in.preload_mesh_textures(meshes, filepath, scene)
 
     if scene.w_parent_meshes:
         main_w = bpy.data.objects.new(bpy.path.basename(filepath), None)
         bpy.context.scene.collection.objects.link(main_w)
 
+    mesh_objects = []
     for rvmesh in meshes:
         me = import_w_mesh(rvmesh, os.path.basename(filepath),filepath, scene, world, envlist=None)
         ob = bpy.data.objects.new(os.path.basename(filepath), me)
         bpy.context.collection.objects.link(ob)
+        mesh_objects.append(ob)
         bpy.context.view_layer.objects.active = ob
 
         if scene.w_parent_meshes:
@@ -79,12 +84,12 @@ def import_file(filepath, scene):
             if scene.w_parent_meshes:
                 bcube.parent = main_w
 
-    texture_animations = [animation.as_dict() for animation in world.animations]
-    scene.texture_animations = str(texture_animations)
+    texanim.set_animations(scene, world.animations)
     scene.ta_max_slots = world.animation_count
     
-    # Run fast batch material assignment after importing the objects
-    fast_batch_assign_materials(scene)
+    # Run batch material assignment on the imported objects
+    assign_materials(mesh_objects)
+    img_in.report_shared_images()
 
     # Return the scene object
     return scene
@@ -174,38 +179,3 @@ def create_cube(scene, sptype, center, radius, filename):
     ob.show_wire = True
 
     return ob
-
-def fast_batch_assign_materials(scene):
-    """Assign materials to all imported mesh objects using batch processing."""
-    mesh_objects = [obj for obj in scene.objects if obj.type == 'MESH']
-
-    # Assign Vertex Color materials (COL)
-    fast_batch_assign_material_choice(mesh_objects, 'COL')
-
-    # Assign UV Texture materials (UV_TEX)
-    fast_batch_assign_material_choice(mesh_objects, 'UV_TEX')
-
-def fast_batch_assign_material_choice(mesh_objects, material_choice):
-    """Batch process material assignment for all objects in the scene."""
-    if not mesh_objects:
-        print("No mesh objects selected for material assignment.")
-        return
-
-    # Set all objects to the desired material choice
-    for obj in mesh_objects:
-        obj.data.material_choice = material_choice
-
-    # Switch to edit mode for all objects at once
-    bpy.ops.object.select_all(action='DESELECT')
-    for obj in mesh_objects:
-        obj.select_set(True)
-
-    # Enter edit mode, select all faces, and apply material assignment
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.object.assign_materials_auto()
-
-    # Return to object mode after processing
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    print(f"Assigned {material_choice} materials to all mesh objects.")
\ No newline at end of file